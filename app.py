@@ -1,14 +1,27 @@
 from services.vlm_service import VLMService
 from services.embedder_service import EmbedderService
 from services.image_processor_service import ImageProcessorService
+from services.reembed_service import ReembedService
+from services.upgrade_queue import UpgradeQueue
+from services.vlm_autotuner import VLMAutotuner
 
 from search.search_engine import SearchEngine
-from utils.file_utils import scan_image_folder, filter_existing_images, fetch_processed_images_paths
+from search.sharded_search import ShardedSearchEngine
+from utils.file_utils import (
+    iter_image_folder,
+    iter_folder_images,
+    iter_unprocessed_images,
+    build_path_indexes
+)
 # from utils.json_db import save_database, load_database, append_to_database
 from utils.json_db import JsonDatabase
+from utils.metadata_utils import build_metadata_record
+from utils.retry_queue import RetryQueue
 from logger import get_logger
 from config import config
 import time
+from itertools import islice
+from pathlib import Path
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -17,69 +30,116 @@ if config.db_backend.lower() == "json":
     logger.warning(f"Current database backend is set to '{config.db_backend}'. This app.py only supports 'json' backend.")
     json_db = JsonDatabase()
 
+# Background VLM worker, created on first import and shared by later imports
+upgrade_queue = None
+
+
 def process_images_flow():
+    global upgrade_queue
+
     folder = input("Enter image folder path: ").strip()
+    priority = input("Priority for this folder (higher first, default 0): ").strip()
     logger.info(f"Processing flow started for folder: {folder}")
     start = time.time()
 
-    # Scan folder for images
-    image_paths = scan_image_folder(folder)
-    if not image_paths:
-        logger.debug("No valid images found in the specified folder.")
-        print("No valid images found.")
-        return
-
-    # Initialize services
+    # Indexes of described and of all indexed images (8 bytes per image, streamed from the DB)
     try:
-        logger.info("Initializing services...")
-        vlm = VLMService()
-        embedder = EmbedderService()
-        processor = ImageProcessorService(vlm, embedder)
+        processed_index, indexed_index, pending_folders = build_path_indexes(json_db.iter_records())
     except Exception as e:
-        logger.exception(f"Service initialization failed: {e}")
-        print("Initialization error. Check logs.")
+        logger.exception(f"Failed to read database: {e}")
+        print("Failed to read database. Check logs.")
         return
 
-    # filter images which has not been processed yet
-    existing_db = json_db.load_database()
-    # processed_images = fetch_processed_images_paths(existing_db)
-    filtered_image_paths = filter_existing_images(image_paths, existing_db)
-    logger.info(f"Images to process: {len(filtered_image_paths)}")
-
-    results = processor.process_images(filtered_image_paths)
-    logger.info(f"Processing completed. Successfully processed: {len(results)}")
-
-    if not results:
-        print("No images processed.")
+    # Tier 1: stream cheap metadata records for images not indexed yet straight to the DB
+    try:
+        indexed = json_db.append_records(
+            build_metadata_record(p)
+            for p in iter_unprocessed_images(iter_image_folder(folder), indexed_index)
+        )
+    except Exception as e:
+        logger.exception(f"Failed to save metadata records: {e}")
+        print("Failed to save database.")
         return
 
-    if json_db.append_to_database(results):
-        logger.info(f"Database updated -> {config.db_path}")
-        print(f"Database saved to: {config.db_path}")
+    if indexed:
+        logger.info(f"Metadata indexed for {indexed} images in {time.time() - start:.2f}s")
+        print(f"{indexed} images searchable by filename, folder and date.")
     else:
-        logger.error("Failed to update database.")
-        print("Failed to save database.")
-
-    logger.info(f"Total processing time: {time.time() - start:.2f}s")
-
+        logger.info(f"No new images found in {folder}")
+        print("No new images to index.")
+
+    # Tier 2: VLM descriptions + embeddings in the background
+    if upgrade_queue is None:
+        try:
+            logger.info("Initializing services...")
+            vlm = VLMService()
+            embedder = EmbedderService()
+            processor = ImageProcessorService(vlm, embedder, RetryQueue())
+        except Exception as e:
+            logger.exception(f"Service initialization failed: {e}")
+            print("Initialization error. Check logs.")
+            return
+        upgrade_queue = UpgradeQueue(processor, json_db)
+        resume_pending(upgrade_queue, pending_folders, processed_index, exclude=folder)
+
+    if priority:
+        try:
+            upgrade_queue.set_folder_priority(folder, int(priority))
+        except ValueError:
+            logger.warning(f"Invalid priority '{priority}', using default.")
+
+    # The folder is re-scanned lazily by the worker instead of holding every path in memory
+    upgrade_queue.enqueue(folder, iter_unprocessed_images(iter_image_folder(folder), processed_index))
+    upgrade_queue.start()
+    print(f"Generating descriptions in the background ({upgrade_queue.pending()} folders queued).")
+
+
+def resume_pending(queue: UpgradeQueue, pending_folders, processed_index, exclude: str):
+    """
+    Queues images indexed in earlier sessions but never described, one
+    job per folder (listed lazily, not recursive). Folders inside the
+    folder being imported are left to its own job.
+    """
+    root = Path(exclude).resolve()
+    resumed = [f for f in pending_folders if not Path(f).resolve().is_relative_to(root)]
+    for pending in resumed:
+        queue.enqueue(pending, iter_unprocessed_images(iter_folder_images(pending), processed_index))
+    if resumed:
+        logger.info(f"Resuming VLM upgrade of {len(resumed)} folders from earlier sessions.")
+        print(f"Resuming descriptions left pending in {len(resumed)} folders from earlier sessions.")
 
 
 def search_flow():
     logger.info("Search flow started.")
-    db = json_db.load_database()
-
-    if not db:
+    # The engine builds its own compact copy; no record dicts are kept here
+    if not json_db.exists():
         logger.warning("Search attempted but database is empty.")
         print("Database is empty. Process images first.")
         return
 
-    embedder = EmbedderService()
-    engine = SearchEngine(embedder)
+    # Shards load (or map) their own part; the stale count comes with the index
+    try:
+        embedder = EmbedderService()
+        if config.search_shards > 1:
+            engine = ShardedSearchEngine(embedder)
+        else:
+            engine = SearchEngine(embedder)
+    except Exception as e:
+        logger.exception(f"Search index build failed: {e}")
+        print("Failed to build search index. Check logs.")
+        return
+    stale = engine.count_stale(embedder.model_id)
+
+    if stale:
+        logger.warning(f"{stale} records were embedded with a different model.")
+        print(f"Warning: {stale} records use an older embedding model. Run 'Re-embed database'.")
 
     print("Type 'exit' to stop.")
     while True:
         query = input("Search: ").strip()
         if query.lower() == "exit":
+            if isinstance(engine, ShardedSearchEngine):
+                engine.close()
             logger.info("Search flow exited.")
             break
 
@@ -92,16 +152,77 @@ def search_flow():
 
         for r in results:
             print(f"[{r['score']:.4f}] {r['path']}")
-            print(f"    Description: {r['description'][:100]}...")
+            if r["tier"] == "metadata":
+                print("    Description: (pending, matched on filename/folder/date)")
+            else:
+                print(f"    Description: {r['description'][:100]}...")
         print()
 
 
+def reembed_flow():
+    logger.info("Re-embed flow started.")
+    start = time.time()
+
+    try:
+        embedder = EmbedderService()
+    except Exception as e:
+        logger.exception(f"Embedder initialization failed: {e}")
+        print("Initialization error. Check logs.")
+        return
+
+    try:
+        updated = ReembedService(embedder, json_db).run()
+    except Exception as e:
+        logger.exception(f"Re-embedding failed: {e}")
+        print("Re-embedding failed. Progress so far is saved; run again to resume.")
+        return
+
+    print(f"Re-embedded {updated} records with {embedder.model_id}.")
+    logger.info(f"Total re-embed time: {time.time() - start:.2f}s")
+
+
+def autotune_flow():
+    global upgrade_queue
+
+    folder = input("Enter calibration image folder path: ").strip()
+    logger.info(f"Autotune flow started for folder: {folder}")
+
+    # The background worker would compete for the CPU and keep a second model
+    # loaded; it is recreated with the tuned settings on the next processing run
+    if upgrade_queue is not None:
+        if upgrade_queue.is_running():
+            print(f"Stopping background processing for autotuning "
+                  f"({upgrade_queue.pending()} folders left; process them again to resume)...")
+            upgrade_queue.stop()
+        upgrade_queue = None
+
+    # Only the first few images are needed; don't list the whole tree
+    image_paths = list(islice(iter_image_folder(folder), config.autotune_images))
+    if len(image_paths) < 2:
+        print("Need at least 2 images for autotuning.")
+        return
+
+    try:
+        result = VLMAutotuner(image_paths).run()
+    except Exception as e:
+        logger.exception(f"Autotune failed: {e}")
+        print("Autotune failed. Check logs.")
+        return
+
+    metrics = result["metrics"]
+    print(f"Best settings: {result['params']}")
+    print(f"    {metrics['images_per_sec']:.3f} images/sec | {metrics['tokens_per_sec']:.1f} tokens/sec")
+    print(f"Profile saved to: {config.vlm_profiles_path}")
+
+
 def main():
     logger.info("Application started.")
 
     while True:
         print("\n1. Process images")
         print("2. Search images")
+        print("3. Re-embed database")
+        print("4. Autotune VLM for this machine")
         print("0. Exit")
 
         choice = input("Choice: ").strip()
@@ -110,7 +231,14 @@ def main():
             process_images_flow()
         elif choice == "2":
             search_flow()
+        elif choice == "3":
+            reembed_flow()
+        elif choice == "4":
+            autotune_flow()
         elif choice == "0":
+            if upgrade_queue is not None and upgrade_queue.is_running():
+                print(f"Stopping background processing ({upgrade_queue.pending()} folders left for next run)...")
+                upgrade_queue.stop()
             logger.info("Application exited by user.")
             break
         else:
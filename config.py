@@ -2,7 +2,7 @@ import os
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 import random
 load_dotenv()
 
@@ -25,6 +25,13 @@ class Config(BaseSettings):
     max_tokens: int = 200
     plugin_id: str = "nexaml"
 
+    # Per-image generation watchdog (0 disables a limit)
+    vlm_timeout_seconds: float = 180.0
+    vlm_stall_seconds: float = 60.0        # max gap between tokens (incl. image prefill)
+    vlm_min_tokens_per_sec: float = 1.0
+    vlm_rate_grace_seconds: float = 30.0   # rate check starts after this
+    vlm_abort_grace_seconds: float = 5.0   # wait for the backend to honour an abort
+
     # VLM Model Configurations Hyper-parameters
     vlm_n_ctx: int = 4096
     vlm_n_threads: Optional[int] = None
@@ -32,22 +39,91 @@ class Config(BaseSettings):
     vlm_n_batch: int = 512
     vlm_n_ubatch: int = 512
 
+    # Autotuning (per-host profile overrides the n_* values above)
+    vlm_use_host_profile: bool = True
+    vlm_profiles_path: Path = DATA_DIR / "vlm_profiles.json"
+    autotune_images: int = 5               # first one is a warm-up
+    autotune_threads: List[int] = []       # empty -> derived from CPU count
+    autotune_batch_sizes: List[int] = [256, 512, 1024]
+
 
     # Embedder
     embedder_model_path: str = "all-MiniLM-L6-v2"
     embedding_dim: int = 384
     embedder_batch_size: int = 32
+    embedder_max_batch_tokens: int = 8192  # padded tokens per encode batch
+    embedder_backend: str = "sentence-transformers"  # Options: sentence-transformers, onnx
+
+    # ONNX embedder (local exported MiniLM, fp32 or int8)
+    embedder_onnx_dir: Path = BASE_DIR / "models" / "all-MiniLM-L6-v2-onnx"
+    embedder_onnx_file: str = "model_quantized.onnx"  # name written by optimum-cli quantize
+    embedder_max_seq_length: int = 256
+    embedder_n_threads: Optional[int] = None
+
+    # Re-embedding (migration after embedder model change)
+    reembed_chunk_size: int = 4096
 
     device: str = "cpu"  # Options: cpu, gpu
     # Database
     db_backend: str = "json"
     db_path: Path = DATA_DIR / "image_database.json"
+    db_fsync: bool = True                           # one fsync per appended batch
+    db_segment_max_bytes: int = 64 * 1024 * 1024    # roll to a new log segment after this
+    db_compact_threshold_bytes: int = 256 * 1024 * 1024  # compact when segments exceed this
 
     # Search Settings
     min_similarity: float = 0.3
     top_k: int = 5
     faiss: bool = False
 
+    # Coarse-to-fine search: PCA-reduced prefilter, then exact re-rank
+    prefilter_dim: int = 0                   # e.g. 64; 0 disables
+    prefilter_min_vectors: int = 50000       # below this a full scan is cheap enough
+    prefilter_candidates_per_k: int = 50     # shortlist = top_k * this (recall vs speed)
+    prefilter_sample_size: int = 100000      # vectors used to fit the projection
+    prefilter_eval_queries: int = 20         # recall/speedup report at build (0 skips)
+
+    # Warm start: search processes memory-map a snapshot of the built index
+    search_snapshot_enabled: bool = True
+    search_snapshot_dir: Path = DATA_DIR / "search_snapshots"
+
+    # Sharded search: one local worker process per shard (1 = single process)
+    search_shards: int = 1
+    search_shard_by: str = "hash"  # Options: hash, folder
+    shard_timeout_seconds: float = 2.0
+    shard_startup_timeout_seconds: float = 300.0
+    # Metadata-only (not yet described) records are matched on keywords
+    lexical_min_match: float = 0.5   # fraction of query terms that must match
+    lexical_score_scale: float = 0.5  # keyword match score = fraction * scale
+
+    # Progressive indexing: background VLM upgrade of metadata-only records
+    folder_priorities: Dict[str, int] = {}  # folder -> priority (higher first)
+    upgrade_flush_every: int = 10
+
+    # Read-ahead of upcoming images (helps on NFS/SMB mounts)
+    prefetch_enabled: bool = True
+    prefetch_workers: int = 4
+    prefetch_min_depth: int = 1
+    prefetch_max_depth: int = 16
+    prefetch_scratch_dir: Optional[Path] = None  # copy to local disk (into a subfolder) instead of page cache only
+
+    # Failed images: persisted retry queue with exponential backoff
+    retry_queue_path: Path = DATA_DIR / "retry_queue.json"
+    retry_max_attempts: int = 3
+    retry_backoff_seconds: float = 60.0
+    retry_backoff_max_seconds: float = 3600.0
+    retry_poll_seconds: float = 30.0
+    retry_priority: int = -1  # relative to folder priorities
+
+    # Ingestion: records buffered per streaming read/write batch
+    ingest_buffer_size: int = 1000
+
+    # Near-duplicates: burst shots within this many of 64 dHash bits of a
+    # recently described image reuse its description (no VLM call)
+    dedup_enabled: bool = True
+    dedup_hamming_threshold: int = 6
+    dedup_window: int = 50  # recent representatives compared against
+
     # Files
     allowed_extensions: List[str] = [".jpg", ".jpeg", ".png"]
 
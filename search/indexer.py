@@ -1,33 +1,113 @@
+import time
 import numpy as np
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Optional
+from config import config
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+# Query perturbation for evaluate_prefilter, relative to the vector norm
+# (0.5 -> cosine of about 0.9 to the stored vector, like a close paraphrase)
+EVAL_NOISE = 0.5
+
 
 class SimpleIndexer:
     """
     Minimal, clean indexer using cosine similarity.
     Works well for small to medium datasets (< 10k).
+
+    For large collections an optional coarse-to-fine mode scores a
+    PCA-reduced copy of the vectors first, then re-ranks only the
+    shortlist with the full vectors (config.prefilter_*).
     """
 
-    def __init__(self, embeddings: np.ndarray):
+    def __init__(self, embeddings: np.ndarray, reduced_dim: Optional[int] = None,
+                 state: Optional[Dict[str, np.ndarray]] = None):
         """
         embeddings: 2D numpy array (N, D)
+        reduced_dim: prefilter dimension; defaults to config.prefilter_dim (0 disables)
+        state: arrays from state() (e.g. a snapshot); skips norms and prefilter fitting
         """
         if embeddings.ndim != 2:
             raise ValueError("Embeddings must be a 2D array")
 
-        self.embeddings = embeddings.astype(np.float32)
+        # No copy when the caller already hands over float32
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        if state is not None:
+            self._norms = state["norms"]
+            self.components = state.get("components")
+            self.reduced = state.get("reduced")
+            logger.info(f"Indexer restored with {len(self.embeddings)} vectors"
+                        f"{' (prefilter on)' if self.reduced is not None else ''}.")
+            return
+
+        self._norms = np.linalg.norm(self.embeddings, axis=1)
+        self._norms[self._norms == 0] = np.inf  # zero vectors score 0
         logger.info(f"Indexer initialized with {len(self.embeddings)} vectors.")
 
+        self.components: Optional[np.ndarray] = None
+        self.reduced: Optional[np.ndarray] = None
+
+        reduced_dim = config.prefilter_dim if reduced_dim is None else reduced_dim
+        if (reduced_dim and reduced_dim < self.embeddings.shape[1]
+                and len(self.embeddings) >= config.prefilter_min_vectors):
+            self._fit_prefilter(reduced_dim)
+            if config.prefilter_eval_queries:
+                self.evaluate_prefilter(config.prefilter_eval_queries)
+
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        Derived arrays needed to restore this indexer without refitting.
+        """
+        state = {"norms": self._norms}
+        if self.reduced is not None:
+            state["components"] = self.components
+            state["reduced"] = self.reduced
+        return state
+
+
+    def _fit_prefilter(self, reduced_dim: int):
+        """
+        Learns a PCA projection from (a sample of) the stored vectors and
+        keeps the projected (N, reduced_dim) matrix for coarse scoring.
+        """
+        start = time.time()
+        rng = np.random.default_rng(0)
+        n = len(self.embeddings)
+        sample = self.embeddings
+        if n > config.prefilter_sample_size:
+            sample = self.embeddings[rng.choice(n, config.prefilter_sample_size, replace=False)]
+
+        centered = sample - sample.mean(axis=0)
+        # Rows of vt are principal directions, strongest first
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:reduced_dim].T, dtype=np.float32)  # (D, d)
+
+        # The mean shifts every score equally, so ranking only needs e @ W
+        self.reduced = self.embeddings @ self.components
+
+        logger.info(f"Prefilter ready: {self.embeddings.shape[1]} -> {reduced_dim} dims "
+                    f"in {time.time() - start:.2f}s")
+
+
+    def _exact_scores(self, query_vec: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        q_norm = np.linalg.norm(query_vec)
+        if q_norm == 0:
+            return np.zeros(len(self.embeddings) if rows is None else len(rows), dtype=np.float32)
+
+        if rows is None:
+            return (self.embeddings @ query_vec) / (self._norms * q_norm)
+        return (self.embeddings[rows] @ query_vec) / (self._norms[rows] * q_norm)
+
 
     @staticmethod
-    def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-        denom = (np.linalg.norm(a) * np.linalg.norm(b))
-        if denom == 0:
-            return 0.0
-        return float(np.dot(a, b) / denom)
+    def _top(scores: np.ndarray, top_k: int) -> np.ndarray:
+        if top_k >= len(scores):
+            return np.argsort(-scores)
+        part = np.argpartition(-scores, top_k)[:top_k]
+        return part[np.argsort(-scores[part])]
 
 
     def query(self, query_vec: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
@@ -35,13 +115,61 @@ class SimpleIndexer:
         Returns:
             List of (index, similarity)
         """
-        sims = []
+        if not len(self.embeddings):
+            return []
+
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+
+        if self.reduced is None:
+            scores = self._exact_scores(query_vec)
+            return [(int(i), float(scores[i])) for i in self._top(scores, top_k)]
+
+        # Stage 1: coarse scores in the reduced space -> shortlist
+        shortlist_size = max(top_k * config.prefilter_candidates_per_k, top_k)
+        coarse = self.reduced @ (query_vec @ self.components)
+        shortlist = self._top(coarse, shortlist_size)
+
+        # Stage 2: exact cosine on the shortlist only
+        scores = self._exact_scores(query_vec, shortlist)
+        order = self._top(scores, top_k)
+        return [(int(shortlist[i]), float(scores[i])) for i in order]
+
+
+    def evaluate_prefilter(self, n_queries: int, top_k: int = None) -> Dict[str, float]:
+        """
+        Measures recall@k and speedup of the two-stage search against an
+        exact scan, using stored vectors perturbed by EVAL_NOISE as queries.
+        """
+        if self.reduced is None:
+            return {}
+
+        top_k = top_k or config.top_k
+        rng = np.random.default_rng(1)
+        picks = rng.choice(len(self.embeddings), min(n_queries, len(self.embeddings)), replace=False)
+        base = self.embeddings[picks]
+        dim = self.embeddings.shape[1]
+        # Noise norm is EVAL_NOISE times the vector's norm, whatever the dimension
+        noise = rng.normal(size=base.shape) / np.sqrt(dim)
+        noise *= EVAL_NOISE * np.linalg.norm(base, axis=1, keepdims=True)
+        queries = (base + noise).astype(np.float32)
 
-        for idx, emb in enumerate(self.embeddings):
-            sim = self._cosine_similarity(query_vec, emb)
-            sims.append((idx, sim))
+        exact_time = fast_time = 0.0
+        hits = 0
+        for q in queries:
+            t = time.perf_counter()
+            exact = set(self._top(self._exact_scores(q), top_k).tolist())
+            exact_time += time.perf_counter() - t
 
+            t = time.perf_counter()
+            fast = {i for i, _ in self.query(q, top_k)}
+            fast_time += time.perf_counter() - t
 
-        sims.sort(key=lambda x: x[1], reverse=True)
+            hits += len(exact & fast)
 
-        return sims[:top_k]
+        report = {
+            "recall_at_k": hits / (len(queries) * min(top_k, len(self.embeddings))),
+            "speedup": exact_time / fast_time if fast_time else 0.0,
+        }
+        logger.info(f"Prefilter recall@{top_k}: {report['recall_at_k']:.3f} | "
+                    f"speedup: {report['speedup']:.1f}x over {len(queries)} queries")
+        return report
@@ -0,0 +1,205 @@
+import re
+from array import array
+from typing import Dict, Any, Iterable, List, Tuple
+
+import numpy as np
+
+from utils.metadata_utils import build_keywords
+from services.embedder_service import vector_model
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+TIER_FULL = 0
+TIER_METADATA = 1
+_TIER_NAMES = {TIER_FULL: "full", TIER_METADATA: "metadata"}
+
+# Split point between folder and file name; accepts both separators
+_LAST_SEP_RE = re.compile(r"[\\/](?=[^\\/]*$)")
+
+
+class RecordStore:
+    """
+    Compact, read-only columnar copy of DB records for search.
+
+    - folders are interned once and referenced by id
+    - file names and descriptions live in contiguous UTF-8 buffers with offsets
+    - embeddings go straight into one float32 matrix; no per-record objects are kept
+    - keywords of metadata-only records go into an inverted index
+
+    Record ids are positions in insertion order; matrix rows map to them
+    via row_records.
+    """
+
+    def __init__(self):
+        self.folders: List[str] = []
+        self._folder_lookup: Dict[str, int] = {}
+
+        self.folder_ids = array("i")
+        self.tiers = array("b")
+        self._name_buf = bytearray()
+        self.name_offsets = array("Q", [0])
+        self._desc_buf = bytearray()
+        self.desc_offsets = array("Q", [0])
+
+        self._rows = array("f")
+        self.row_records = array("i")
+        self._postings: Dict[str, array] = {}
+
+        self.mismatched = 0
+        self.embedder_models: Dict[str, int] = {}  # described records per vector_model()
+        self.matrix = np.empty((0, config.embedding_dim), dtype=np.float32)
+
+
+    def __len__(self) -> int:
+        return len(self.folder_ids)
+
+
+    def _intern_folder(self, folder: str) -> int:
+        folder_id = self._folder_lookup.get(folder)
+        if folder_id is None:
+            folder_id = len(self.folders)
+            self.folders.append(folder)
+            self._folder_lookup[folder] = folder_id
+        return folder_id
+
+
+    def add(self, record: Dict[str, Any]):
+        record_id = len(self)
+        path = record["path"]
+
+        # Keep the exact original string: folder part includes the separator
+        m = _LAST_SEP_RE.search(path)
+        split = m.end() if m else 0
+        self.folder_ids.append(self._intern_folder(path[:split]))
+        self._name_buf += path[split:].encode("utf-8")
+        self.name_offsets.append(len(self._name_buf))
+
+        self._desc_buf += (record.get("description") or "").encode("utf-8")
+        self.desc_offsets.append(len(self._desc_buf))
+
+        tier = TIER_METADATA if record.get("tier") == "metadata" else TIER_FULL
+        self.tiers.append(tier)
+
+        model = vector_model(record)
+        if model is not None:
+            self.embedder_models[model] = self.embedder_models.get(model, 0) + 1
+
+        emb = record.get("embedding")
+        if emb and len(emb) == config.embedding_dim:
+            self._rows.extend(emb)
+            self.row_records.append(record_id)
+        elif emb:
+            self.mismatched += 1
+
+        if tier == TIER_METADATA:
+            for token in record.get("keywords") or build_keywords(path, record.get("exif")):
+                self._postings.setdefault(token, array("i")).append(record_id)
+
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "RecordStore":
+        store = cls()
+        for record in records:
+            store.add(record)
+        store.finalize()
+        return store
+
+
+    def finalize(self):
+        """
+        Freezes the buffers and exposes the embedding matrix (zero-copy view).
+        """
+        self.name_buf = bytes(self._name_buf)
+        self.desc_buf = bytes(self._desc_buf)
+        del self._name_buf, self._desc_buf
+
+        if len(self._rows):
+            self.matrix = np.frombuffer(self._rows, dtype=np.float32).reshape(-1, config.embedding_dim)
+        self.keyword_index = {token: np.frombuffer(ids, dtype=np.int32) for token, ids in self._postings.items()}
+        del self._postings
+
+        if self.mismatched:
+            logger.warning(f"Skipped {self.mismatched} embeddings with a dimension other than "
+                           f"{config.embedding_dim}. Run 'Re-embed database' to migrate them.")
+
+        logger.info(f"Record store built: {len(self)} records, {len(self.row_records)} vectors, "
+                    f"{len(self.folders)} folders, {self.nbytes() / 1e6:.1f} MB")
+
+
+    def to_arrays(self) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+        """
+        Flat numpy columns plus the interned strings, for snapshots.
+        Postings are concatenated with per-token offsets.
+        """
+        tokens = list(self.keyword_index)
+        lengths = [len(self.keyword_index[t]) for t in tokens]
+        postings = (np.concatenate([self.keyword_index[t] for t in tokens]) if tokens
+                    else np.empty(0, dtype=np.int32))
+        arrays = {
+            "folder_ids": np.asarray(self.folder_ids, dtype=np.int32),
+            "tiers": np.asarray(self.tiers, dtype=np.int8),
+            "name_buf": np.frombuffer(self.name_buf, dtype=np.uint8),
+            "name_offsets": np.asarray(self.name_offsets, dtype=np.uint64),
+            "desc_buf": np.frombuffer(self.desc_buf, dtype=np.uint8),
+            "desc_offsets": np.asarray(self.desc_offsets, dtype=np.uint64),
+            "matrix": self.matrix,
+            "row_records": np.asarray(self.row_records, dtype=np.int32),
+            "postings": postings.astype(np.int32, copy=False),
+            "posting_offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64),
+        }
+        return arrays, {"folders": self.folders, "tokens": tokens, "embedder_models": self.embedder_models}
+
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], strings: Dict[str, List[str]]) -> "RecordStore":
+        """
+        Rebuilds a finalized store from to_arrays() output without copying
+        (the arrays may be memory-mapped).
+        """
+        store = cls.__new__(cls)
+        store.folders = strings["folders"]
+        store._folder_lookup = {}
+        store.folder_ids = arrays["folder_ids"]
+        store.tiers = arrays["tiers"]
+        store.name_buf = arrays["name_buf"]
+        store.name_offsets = arrays["name_offsets"]
+        store.desc_buf = arrays["desc_buf"]
+        store.desc_offsets = arrays["desc_offsets"]
+        store.matrix = arrays["matrix"]
+        store.row_records = arrays["row_records"]
+        store.mismatched = 0
+        store.embedder_models = strings["embedder_models"]
+
+        postings, offsets = arrays["postings"], arrays["posting_offsets"]
+        store.keyword_index = {
+            token: postings[offsets[i]:offsets[i + 1]] for i, token in enumerate(strings["tokens"])
+        }
+        return store
+
+
+    def nbytes(self) -> int:
+        columns = (self.folder_ids, self.tiers, self.name_offsets, self.desc_offsets, self.row_records)
+        return (
+            self.matrix.nbytes + len(self.name_buf) + len(self.desc_buf)
+            + sum(c.itemsize * len(c) for c in columns)
+            + sum(len(f) for f in self.folders)
+        )
+
+
+    # bytes() accepts both the in-memory buffers and memory-mapped snapshot arrays
+    def filename(self, record_id: int) -> str:
+        return bytes(self.name_buf[self.name_offsets[record_id]:self.name_offsets[record_id + 1]]).decode("utf-8")
+
+
+    def path(self, record_id: int) -> str:
+        return self.folders[self.folder_ids[record_id]] + self.filename(record_id)
+
+
+    def description(self, record_id: int) -> str:
+        return bytes(self.desc_buf[self.desc_offsets[record_id]:self.desc_offsets[record_id + 1]]).decode("utf-8")
+
+
+    def tier(self, record_id: int) -> str:
+        return _TIER_NAMES[int(self.tiers[record_id])]
@@ -1,8 +1,12 @@
 import numpy as np
-from typing import List, Dict, Tuple, Any
+from collections import Counter
+from typing import List, Dict, Tuple, Any, Optional, Callable
 
 from utils.json_db import JsonDatabase
+from utils.metadata_utils import tokenize
 from search.indexer import SimpleIndexer
+from search.record_store import RecordStore, TIER_METADATA
+from search.snapshot import fingerprint, load_snapshot, save_snapshot
 from services.embedder_service import EmbedderService
 
 from config import config
@@ -13,76 +17,139 @@ logger = get_logger(__name__)
 json_db = JsonDatabase()
 
 class SearchEngine:
-    def __init__(self, embedder: EmbedderService):
+    def __init__(self,
+                 embedder: Optional[EmbedderService],
+                 records: Optional[List[Dict[str, Any]]] = None,
+                 db: Optional[JsonDatabase] = None,
+                 keep: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                 snapshot_name: Optional[str] = "main"):
+        """
+        embedder: encodes queries; may be None when only search_encoded is used
+        records: DB records to index; defaults to the DB records passing keep
+        snapshot_name: on-disk snapshot to warm start from and to write after
+            a build (config.search_snapshot_*); not used with explicit records
+        """
         self.embedder = embedder
-        self.db = json_db.load_database()
+        db = db or json_db
 
-        if not self.db:
-            logger.warning("Empty or missing database. Search will return no results.")
+        self.store = None
+        indexer_state = None
+        fp = None
+        if records is None and snapshot_name and config.search_snapshot_enabled:
+            fp = fingerprint(snapshot_name, db)
+            loaded = load_snapshot(snapshot_name, fp)
+            if loaded is not None:
+                self.store, indexer_state = loaded
 
-        self._build_embedding_matrix()
+        if self.store is None:
+            # Merged records are streamed into the columnar store one path at a time
+            if records is None:
+                records = db.iter_merged(keep=keep)
 
+            self.store = RecordStore.from_records(records)
 
-    def _build_embedding_matrix(self):
-        vectors = []
+            if not len(self.store):
+                logger.warning("Empty or missing database. Search will return no results.")
 
-        for entry in self.db:
-            emb = entry.get("embedding")
-            if emb:
-                vectors.append(np.array(emb, dtype=np.float32))
-            else:
-                vectors.append(None)
+        self.keyword_index = self.store.keyword_index
+        self._build_indexer(indexer_state)
 
-        # Filter out invalid entries
-        self.valid_entries = [
-            (i, vec)
-            for i, vec in enumerate(vectors)
-            if isinstance(vec, np.ndarray)
-        ]
+        if fp is not None and indexer_state is None and len(self.store):
+            save_snapshot(snapshot_name, fp, self.store, self.indexer.state() if self.indexer else {})
 
-        if not self.valid_entries:
+
+    def _build_indexer(self, state: Optional[Dict[str, np.ndarray]] = None):
+        if self.keyword_index:
+            pending = int((np.frombuffer(self.store.tiers, dtype=np.int8) == TIER_METADATA).sum())
+            logger.info(f"Keyword index ready for {pending} records awaiting descriptions.")
+
+        if not len(self.store.row_records):
             logger.error("No valid embeddings found in DB.")
             self.indexer = None
             return
 
-        # Stack embeddings
-        matrix = np.vstack([vec for _, vec in self.valid_entries])
-        self.indexer = SimpleIndexer(matrix)
+        self.indexer = SimpleIndexer(self.store.matrix, state=state or None)
+
+        logger.info(f"Search engine ready with {len(self.store.row_records)} vectors.")
+
+
+    def count_stale(self, model_id: str) -> int:
+        """
+        Described records whose vectors come from another embedder model.
+        Taken from the store (and its snapshot), so no extra DB pass.
+        """
+        return sum(n for model, n in self.store.embedder_models.items() if model != model_id)
+
+
+    def _keyword_search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """
+        Returns:
+            List of (record_id, score) for metadata-only records
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.keyword_index:
+            return []
+
+        hits = Counter()
+        for term in terms:
+            for i in self.keyword_index.get(term, ()):
+                hits[int(i)] += 1
 
-        logger.info(f"Search engine ready with {len(self.valid_entries)} vectors.")
+        matches = []
+        for i, count in hits.items():
+            fraction = count / len(terms)
+            if fraction >= config.lexical_min_match:
+                matches.append((i, fraction * config.lexical_score_scale))
+
+        matches.sort(key=lambda x: x[1], reverse=True)
+        return matches[:top_k]
 
 
     def search(self, query: str, top_k: int = None, min_similarity: float = None):
-        if self.indexer is None:
+        if self.indexer is None and not self.keyword_index:
             logger.error("Search index not available.")
             return []
 
+        q_emb = None
+        if self.indexer is not None:
+            # Encode query
+            q_emb = self.embedder.encode(query)
+            if q_emb is None:
+                logger.error("Query embedding failed.")
+                return []
+
+        return self.search_encoded(query, q_emb, top_k, min_similarity)
+
+
+    def search_encoded(self, query: str, q_emb: Optional[np.ndarray],
+                       top_k: int = None, min_similarity: float = None):
+        """
+        Search with an already encoded query (q_emb may be None for keyword-only).
+        Lets a coordinator encode once and fan the vector out to shards.
+        """
         top_k = top_k or config.top_k
         min_similarity = min_similarity or config.min_similarity
 
-        # Encode query
-        q_emb = self.embedder.encode(query)
-        if q_emb is None:
-            logger.error("Query embedding failed.")
-            return []
-
-        # Query the index
-        raw_results = self.indexer.query(q_emb, top_k=top_k)
+        scored: List[Tuple[int, float]] = []
 
-        # Filter and map results
-        results = []
-        for rank, (idx, score) in enumerate(raw_results):
-            if score < min_similarity:
-                continue
+        if self.indexer is not None and q_emb is not None:
+            # Query the index
+            for idx, score in self.indexer.query(q_emb, top_k=top_k):
+                if score >= min_similarity:
+                    scored.append((self.store.row_records[idx], score))
 
-            db_index = self.valid_entries[idx][0]
-            record = self.db[db_index]
+        scored.extend(self._keyword_search(query, top_k))
+        scored.sort(key=lambda x: x[1], reverse=True)
 
+        # Map results
+        results = []
+        for record_id, score in scored[:top_k]:
             results.append({
                 "score": float(score),
-                "path": record["path"],
-                "filename": record["filename"],
-                "description": record["description"]
+                "path": self.store.path(record_id),
+                "filename": self.store.filename(record_id),
+                "description": self.store.description(record_id),
+                "tier": self.store.tier(record_id)
             })
 
         return results
@@ -0,0 +1,242 @@
+import hashlib
+import heapq
+import itertools
+import multiprocessing as mp
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import List, Dict, Optional, Any
+
+from utils.json_db import JsonDatabase
+from search.search_engine import SearchEngine
+from services.embedder_service import EmbedderService
+
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def shard_of(record_path: str, num_shards: int) -> int:
+    """
+    Stable shard id for a record, by path hash or by parent folder
+    (config.search_shard_by), so a folder can be kept on one shard.
+    """
+    key = str(Path(record_path).parent) if config.search_shard_by == "folder" else record_path
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+def _shard_worker(shard_id: int, num_shards: int, db_path: str, conn):
+    """
+    Worker process: indexes only its shard of the DB and answers
+    (query_id, query, q_emb, top_k, min_similarity) messages until it
+    receives None.
+    """
+    engine = SearchEngine(
+        None,
+        db=JsonDatabase(db_path),
+        keep=lambda r: shard_of(r.get("path", ""), num_shards) == shard_id,
+        snapshot_name=f"shard-{shard_id}-of-{num_shards}-{config.search_shard_by}",
+    )
+    n_records = len(engine.store)
+    conn.send(("ready", n_records, engine.store.embedder_models))
+    logger.info(f"Search shard {shard_id}/{num_shards} ready with {n_records} records.")
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+
+        query_id, query, q_emb, top_k, min_similarity = msg
+        try:
+            results = engine.search_encoded(query, q_emb, top_k, min_similarity)
+        except Exception as e:
+            logger.exception(f"Shard {shard_id} search failed: {e}")
+            results = []
+        conn.send((query_id, results))
+
+    conn.close()
+
+
+class ShardedSearchEngine:
+    """
+    Splits the index across local worker processes (one per shard).
+    A query is encoded once, fanned out to every ready shard, and the
+    per-shard top-k lists are merged with a heap. Shards that are slow,
+    still loading or dead are skipped for that query and restarted.
+    """
+
+    def __init__(self, embedder: EmbedderService, num_shards: int = None, db: JsonDatabase = None):
+        self.embedder = embedder
+        self.num_shards = num_shards or config.search_shards
+        self.db_path = str((db or JsonDatabase()).db_path)
+
+        self._ctx = mp.get_context("spawn")
+        self._procs: List[Optional[Any]] = [None] * self.num_shards
+        self._conns: List[Optional[Any]] = [None] * self.num_shards
+        self._ready = [False] * self.num_shards
+        self._embedder_models: List[Dict[str, int]] = [{} for _ in range(self.num_shards)]
+        self._query_ids = itertools.count()
+
+        for shard_id in range(self.num_shards):
+            self._start_worker(shard_id)
+        self._wait_ready(config.shard_startup_timeout_seconds)
+
+
+    def _start_worker(self, shard_id: int):
+        if self._conns[shard_id] is not None:
+            self._conns[shard_id].close()
+
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_shard_worker,
+            args=(shard_id, self.num_shards, self.db_path, child_conn),
+            name=f"search-shard-{shard_id}",
+            daemon=True
+        )
+        proc.start()
+        child_conn.close()
+
+        self._procs[shard_id] = proc
+        self._conns[shard_id] = parent_conn
+        self._ready[shard_id] = False
+        logger.debug(f"Started search shard {shard_id} (pid {proc.pid})")
+
+
+    def _restart_dead(self):
+        for shard_id, proc in enumerate(self._procs):
+            if proc is None or not proc.is_alive():
+                logger.warning(f"Search shard {shard_id} is down, restarting.")
+                self._start_worker(shard_id)
+
+
+    def _receive(self, shard_id: int):
+        try:
+            return self._conns[shard_id].recv()
+        except (EOFError, OSError):
+            logger.error(f"Search shard {shard_id} connection lost.")
+            self._ready[shard_id] = False
+            return None
+
+
+    def _handle(self, shard_id: int, msg) -> Optional[tuple]:
+        """
+        Processes a message from a shard; returns it if it is a query reply.
+        """
+        if msg is None:
+            return None
+        if msg[0] == "ready":
+            self._ready[shard_id] = True
+            self._embedder_models[shard_id] = msg[2]
+            logger.info(f"Search shard {shard_id} ready with {msg[1]} records.")
+            return None
+        return msg
+
+
+    def _wait_ready(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        waiting = {self._conns[i]: i for i in range(self.num_shards) if not self._ready[i]}
+
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in wait(list(waiting), timeout=remaining):
+                shard_id = waiting[conn]
+                msg = self._receive(shard_id)
+                self._handle(shard_id, msg)
+                if msg is None or self._ready[shard_id]:
+                    waiting.pop(conn)
+
+        ready = sum(self._ready)
+        if ready < self.num_shards:
+            logger.warning(f"Only {ready}/{self.num_shards} search shards ready; continuing with partial index.")
+        else:
+            logger.info(f"All {self.num_shards} search shards ready.")
+
+
+    def _drain(self):
+        """
+        Consumes pending messages (readiness, late replies) without blocking.
+        """
+        conns = {self._conns[i]: i for i in range(self.num_shards)}
+        for conn in wait(list(conns), timeout=0):
+            self._handle(conns[conn], self._receive(conns[conn]))
+
+
+    def count_stale(self, model_id: str) -> int:
+        """
+        Stale-model count reported by the shards that are ready; the
+        coordinator never reads the DB itself.
+        """
+        return sum(
+            n for models in self._embedder_models for model, n in models.items() if model != model_id
+        )
+
+
+    def search(self, query: str, top_k: int = None, min_similarity: float = None) -> List[Dict[str, Any]]:
+        top_k = top_k or config.top_k
+
+        self._restart_dead()
+        self._drain()
+
+        q_emb = self.embedder.encode(query)
+        if q_emb is None:
+            logger.error("Query embedding failed.")
+            return []
+
+        query_id = next(self._query_ids)
+        pending: Dict[Any, int] = {}
+
+        for shard_id in range(self.num_shards):
+            if not self._ready[shard_id]:
+                continue
+            try:
+                self._conns[shard_id].send((query_id, query, q_emb, top_k, min_similarity))
+                pending[self._conns[shard_id]] = shard_id
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to send query to shard {shard_id}: {e}")
+                self._ready[shard_id] = False
+
+        if len(pending) < self.num_shards:
+            logger.warning(f"Searching {len(pending)}/{self.num_shards} shards; results may be incomplete.")
+
+        results: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + config.shard_timeout_seconds
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in wait(list(pending), timeout=remaining):
+                shard_id = pending[conn]
+                reply = self._handle(shard_id, self._receive(shard_id))
+                if not self._ready[shard_id]:
+                    pending.pop(conn)
+                elif reply is not None and reply[0] == query_id:
+                    results.extend(reply[1])
+                    pending.pop(conn)
+                # Replies to earlier, timed-out queries are dropped
+
+        if pending:
+            logger.warning(f"Shards {sorted(pending.values())} did not answer within "
+                           f"{config.shard_timeout_seconds}s; returning partial results.")
+
+        return heapq.nlargest(top_k, results, key=lambda r: r["score"])
+
+
+    def close(self):
+        for shard_id, conn in enumerate(self._conns):
+            try:
+                conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        logger.info("Search shards stopped.")
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.json_db import JsonDatabase
+from search.record_store import RecordStore
+
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bump whenever the snapshot layout or anything baked into it changes
+SNAPSHOT_VERSION = 3
+MANIFEST = "manifest.json"
+STRINGS = "strings.json"
+INDEXER_PREFIX = "indexer_"
+
+
+def fingerprint(name: str, db: JsonDatabase) -> str:
+    """
+    Identifies the inputs of a build: DB files (name, size, mtime) and the
+    settings that shape the store and indexer. Any change means rebuild.
+    """
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "name": name,
+        "db": db.file_stats(),
+        "embedding_dim": config.embedding_dim,
+        "prefilter": [config.prefilter_dim, config.prefilter_min_vectors, config.prefilter_sample_size],
+    }
+    return hashlib.blake2b(json.dumps(payload).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _snapshot_dir(name: str, fp: str) -> Path:
+    return Path(config.search_snapshot_dir) / f"{name}-{fp}"
+
+
+def load_snapshot(name: str, fp: str) -> Optional[Tuple[RecordStore, Dict[str, np.ndarray]]]:
+    """
+    Memory-maps a matching snapshot. Returns (store, indexer_state), or
+    None when there is none or it does not match (caller rebuilds).
+    """
+    directory = _snapshot_dir(name, fp)
+    try:
+        with open(directory / MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Unreadable search snapshot {directory}: {e}")
+        shutil.rmtree(directory, ignore_errors=True)  # let the rebuild replace it
+        return None
+
+    if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("fingerprint") != fp:
+        logger.info(f"Search snapshot {directory.name} is outdated, rebuilding.")
+        shutil.rmtree(directory, ignore_errors=True)
+        return None
+
+    try:
+        arrays = {key: np.load(directory / f"{key}.npy", mmap_mode="r") for key in manifest["arrays"]}
+        with open(directory / STRINGS, "r", encoding="utf-8") as f:
+            strings = json.load(f)
+    except Exception as e:
+        logger.warning(f"Failed to map search snapshot {directory}: {e}")
+        shutil.rmtree(directory, ignore_errors=True)
+        return None
+
+    indexer_state = {
+        key[len(INDEXER_PREFIX):]: arrays.pop(key)
+        for key in list(arrays) if key.startswith(INDEXER_PREFIX)
+    }
+    logger.info(f"Mapped search snapshot: {directory}")
+    return RecordStore.from_arrays(arrays, strings), indexer_state
+
+
+def save_snapshot(name: str, fp: str, store: RecordStore, indexer_state: Dict[str, np.ndarray]) -> bool:
+    """
+    Writes the snapshot into a private temp directory and renames it into
+    place, so readers only ever see complete snapshots. Older snapshots
+    of the same name are removed afterwards.
+    """
+    root = Path(config.search_snapshot_dir)
+    final = _snapshot_dir(name, fp)
+    if final.exists():
+        return True
+
+    tmp = root / f".{final.name}.tmp-{os.getpid()}"
+    try:
+        tmp.mkdir(parents=True, exist_ok=True)
+        arrays, strings = store.to_arrays()
+        arrays.update({INDEXER_PREFIX + key: value for key, value in indexer_state.items()})
+
+        for key, value in arrays.items():
+            np.save(tmp / f"{key}.npy", np.ascontiguousarray(value), allow_pickle=False)
+        with open(tmp / STRINGS, "w", encoding="utf-8") as f:
+            json.dump(strings, f, ensure_ascii=False)
+        # Manifest last: a directory without one is never loaded
+        with open(tmp / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump({"version": SNAPSHOT_VERSION, "fingerprint": fp, "arrays": list(arrays)}, f)
+
+        try:
+            os.rename(tmp, final)
+        except OSError:
+            # Another process published the same snapshot first
+            shutil.rmtree(tmp, ignore_errors=True)
+            return final.exists()
+    except Exception as e:
+        logger.warning(f"Failed to write search snapshot {final}: {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+
+    logger.info(f"Search snapshot written: {final}")
+
+    # Processes still mapping an old snapshot keep their open files (POSIX)
+    stale = re.compile(re.escape(name) + r"-[0-9a-f]{32}$")
+    for other in root.iterdir():
+        if other != final and stale.match(other.name):
+            shutil.rmtree(other, ignore_errors=True)
+    return True
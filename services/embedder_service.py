@@ -1,8 +1,6 @@
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 import numpy as np
 
-from sentence_transformers import SentenceTransformer
-
 from config import config
 from logger import get_logger
 
@@ -10,23 +8,56 @@ from logger import get_logger
 logger = get_logger(__name__)
 
 
+def vector_model(record: Dict[str, Any]) -> Optional[str]:
+    """
+    Embedder model behind a merged record's vector, compared against
+    EmbedderService.model_id to find stale vectors (re-embed, search).
+    None for records without a description (nothing to embed); "" when
+    the vector is missing or has another dimension (stale for any model).
+    """
+    if not record.get("description"):
+        return None
+    emb = record.get("embedding")
+    if not emb or len(emb) != config.embedding_dim:
+        return ""
+    return record.get("embedder_model") or ""
+
 
 class EmbedderService:
     def __init__(self):
-        self.model: Optional[SentenceTransformer] = None
+        # SentenceTransformer or OnnxSentenceEncoder; both expose the same encode()
+        self.model = None
+        self.model_id: Optional[str] = None
         logger.debug("EmbedderService initializing...")
         self._load_model()
 
     def _load_model(self):
         try:
-            logger.info(f"Loading embedder model: {config.embedder_model_path}")
-
-            self.model = SentenceTransformer(
-                config.embedder_model_path,
-                # device=config.embedder_device
-            )
-
-            logger.info("Embedder loaded successfully.")
+            backend = config.embedder_backend.lower()
+
+            if backend == "onnx":
+                from services.onnx_embedder import OnnxSentenceEncoder
+
+                logger.info(f"Loading ONNX embedder: {config.embedder_onnx_dir / config.embedder_onnx_file}")
+                self.model = OnnxSentenceEncoder(
+                    config.embedder_onnx_dir,
+                    config.embedder_onnx_file,
+                    max_seq_length=config.embedder_max_seq_length,
+                    n_threads=config.embedder_n_threads
+                )
+            elif backend == "sentence-transformers":
+                from sentence_transformers import SentenceTransformer
+
+                logger.info(f"Loading embedder model: {config.embedder_model_path}")
+                self.model = SentenceTransformer(
+                    config.embedder_model_path,
+                    device="cuda" if config.device.lower() == "gpu" else "cpu"
+                )
+            else:
+                raise ValueError(f"Unknown embedder backend: {config.embedder_backend}")
+
+            self.model_id = self._build_model_id()
+            logger.info(f"Embedder loaded successfully ({self.model_id}).")
             logger.debug(f"Embedder device: {getattr(self.model, '_target_device', 'unknown')}")
 
         except Exception as e:
@@ -34,6 +65,16 @@ class EmbedderService:
             raise RuntimeError(f"Embedder initialization failed: {e}")
         
 
+    @staticmethod
+    def _build_model_id() -> str:
+        """
+        Identifies which encoder produced a vector. Stored on every DB record
+        so vectors from a different model can be detected and re-embedded.
+        """
+        if config.embedder_backend.lower() == "onnx":
+            return f"onnx:{config.embedder_onnx_dir.name}/{config.embedder_onnx_file}"
+        return f"sentence-transformers:{config.embedder_model_path}"
+
     def encode(self, text: str, normalize: bool = True) -> Optional[np.ndarray]:
         """
         Encode a single text into a vector.
@@ -68,10 +109,74 @@ class EmbedderService:
             logger.error(f"Failed to encode text: {e}")
             return None
         
-    def encode_batch(self, texts: List[str], normalize: bool = True) -> List[np.ndarray]:
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """
+        Token count per text (with special tokens, after truncation).
+        Falls back to a whitespace estimate if the tokenizer is unavailable.
+        """
+        try:
+            if hasattr(self.model, "token_lengths"):
+                return self.model.token_lengths(texts)
+
+            tokenized = self.model.tokenizer(
+                texts,
+                truncation=True,
+                max_length=self.model.max_seq_length
+            )
+            return [len(ids) for ids in tokenized["input_ids"]]
+
+        except Exception as e:
+            logger.debug(f"Tokenizer length lookup failed, estimating from words: {e}")
+            return [len(t.split()) + 2 for t in texts]
+
+    @staticmethod
+    def _build_buckets(lengths: List[int]) -> List[List[int]]:
+        """
+        Groups text indices into batches of similar token length.
+        Longest texts go first; a batch closes once padding it to its longest
+        member would exceed embedder_max_batch_tokens or it hits embedder_batch_size.
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+        buckets: List[List[int]] = []
+        current: List[int] = []
+        current_max = 0
+
+        for idx in order:
+            longest = max(current_max, lengths[idx])
+            if current and (
+                (len(current) + 1) * longest > config.embedder_max_batch_tokens
+                or len(current) >= config.embedder_batch_size
+            ):
+                buckets.append(current)
+                current, longest = [], lengths[idx]
+            current.append(idx)
+            current_max = longest
+
+        if current:
+            buckets.append(current)
+
+        return buckets
+
+    def _encode_bucket(self, texts: List[str], normalize: bool) -> np.ndarray:
+        embeddings = self.model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+
+        if normalize:
+            embeddings = self.normalize(embeddings)
+
+        return embeddings
+
+    def encode_batch(self, texts: List[str], normalize: bool = True) -> List[Optional[np.ndarray]]:
         """
         Encode multiple texts at once (efficient).
-        Returns list of numpy vectors.
+        Texts are bucketed by token length so short descriptions are not padded
+        to the longest one; output keeps the input order.
+        Returns list of numpy vectors, with None for texts that could not be encoded.
         """
 
         if not self.model:
@@ -81,40 +186,57 @@ class EmbedderService:
         if not texts:
             logger.warning("encode_batch called with an empty text list.")
             return []
-        
-        try:
-            logger.debug(f"Batch encoding {len(texts)} texts "
-                         f"(first preview: {texts[0][:60]}...)")
 
-            embeddings = self.model.encode(
-                texts,
-                batch_size=config.embedder_batch_size,
-                convert_to_numpy=True,
-                show_progress_bar=False
-            ).astype(np.float32)
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
 
-            logger.debug(f"Batch raw embeddings shape: {embeddings.shape}")
+        valid = [i for i, t in enumerate(texts) if t and t.strip()]
+        if len(valid) < len(texts):
+            logger.warning(f"Skipping {len(texts) - len(valid)} empty texts in batch encode.")
+        if not valid:
+            return results
 
-            if normalize:
-                embeddings = np.vstack([self.normalize(v) for v in embeddings])
-                logger.debug("Batch embeddings normalized.")
+        logger.debug(f"Batch encoding {len(valid)} texts "
+                     f"(first preview: {texts[valid[0]][:60]}...)")
 
-            return list(embeddings)
+        lengths = self._token_lengths([texts[i] for i in valid])
+        buckets = self._build_buckets(lengths)
+        logger.debug(f"Batch split into {len(buckets)} length buckets "
+                     f"(token budget: {config.embedder_max_batch_tokens})")
 
-        except Exception as e:
-            logger.exception(f"Batch encoding failed: {e}")
-            return []
+        for bucket in buckets:
+            indices = [valid[b] for b in bucket]
+
+            try:
+                embeddings = self._encode_bucket([texts[i] for i in indices], normalize)
+                for i, emb in zip(indices, embeddings):
+                    results[i] = emb
+                continue
+            except Exception as e:
+                logger.warning(f"Bucket of {len(indices)} texts failed, retrying individually: {e}")
+
+            # Isolate the failing item(s) so the rest of the bucket still succeeds
+            for i in indices:
+                try:
+                    results[i] = self._encode_bucket([texts[i]], normalize)[0]
+                except Exception as e:
+                    logger.error(f"Failed to encode text at index {i}: {e}")
+
+        failed = sum(1 for i in valid if results[i] is None)
+        if failed:
+            logger.warning(f"Batch encoding finished with {failed}/{len(texts)} failures.")
+
+        return results
 
     @staticmethod
     def normalize(vec: np.ndarray) -> np.ndarray:
         """
-        Normalizes vector to unit length.
+        Normalizes a vector (D,) or each row of a matrix (N, D) to unit length.
         Helps cosine similarity behave correctly.
         """
 
-        norm = np.linalg.norm(vec)
-        if norm == 0.0:
+        norms = np.linalg.norm(vec, axis=-1, keepdims=True)
+        zero = norms == 0.0
+        if np.any(zero):
             logger.warning("Attempted to normalize zero-vector.")
-            return vec
 
-        return vec / norm
\ No newline at end of file
+        return vec / np.where(zero, 1.0, norms)
\ No newline at end of file
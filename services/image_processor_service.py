@@ -1,11 +1,11 @@
-from typing import Optional, Dict, List
+from typing import Optional, Dict
 from pathlib import Path
 import time
 
-from tqdm import tqdm
-
 from services.vlm_service import VLMService
 from services.embedder_service import EmbedderService
+from utils.retry_queue import RetryQueue
+from utils.dedup import DuplicateDetector, dhash
 
 from config import config
 from logger import get_logger
@@ -15,13 +15,20 @@ logger = get_logger(__name__)
 
 
 class ImageProcessorService:
-    def __init__(self, vlm: VLMService, embedder: EmbedderService):
+    def __init__(self, vlm: VLMService, embedder: EmbedderService, retry_queue: Optional[RetryQueue] = None):
         logger.debug("Initializing ImageProcessorService...")
         self.vlm = vlm
         self.embedder = embedder
+        self.retry_queue = retry_queue
+        self.dedup = DuplicateDetector() if config.dedup_enabled else None
         logger.debug("ImageProcessorService initialized.")
 
 
+    def _record_failure(self, image_path: str, reason: str):
+        if self.retry_queue is not None:
+            self.retry_queue.record_failure(str(image_path), reason)
+
+
 
     @staticmethod
     def _validate_image(image_path: str) -> bool:
@@ -36,10 +43,16 @@ class ImageProcessorService:
         return True
 
 
-    def process_image(self, image_path: str) -> Optional[Dict]:
+    def process_image(self, image_path: str, read_path: Optional[str] = None) -> Optional[Dict]:
+        """
+        read_path: where to read the image bytes from (e.g. a prefetched
+        local copy); the record always keeps image_path.
+        """
         logger.info(f"Starting processing: {image_path}")
         if not self._validate_image(image_path):
             logger.warning(f"Image validation failed: {image_path}")
+            # Must advance the retry entry, or a vanished file is retried forever
+            self._record_failure(image_path, "missing or unsupported file")
             return None
 
         image_path = str(image_path)
@@ -50,16 +63,36 @@ class ImageProcessorService:
         start_time = time.time()
         logger.debug(f"Processing started at {start_time}")
 
+        # Step 0: burst shots / near-identical frames reuse a recent description
+        phash = None
+        if self.dedup is not None:
+            phash = dhash(read_path or image_path)
+            rep = self.dedup.match(phash)
+            if rep is not None:
+                logger.info(f"Reused description of {rep['filename']} for near-duplicate {image_name}")
+                if self.retry_queue is not None:
+                    self.retry_queue.record_success(image_path)
+                return {
+                    **rep,
+                    "path": image_path,
+                    "filename": image_name,
+                    "embedding": list(rep["embedding"]),
+                    "phash": f"{phash:016x}",
+                    "duplicate_of": rep["path"],
+                }
+
         # Step 1: Generate description
         try:
             logger.debug(f"Generating description for {image_name}")
-            description = self.vlm.generate_description(image_path)
+            description = self.vlm.generate_description(read_path or image_path)
         except Exception as e:
             logger.exception(f"Exception during description generation for {image_name}: {e}")
+            self._record_failure(image_path, f"error: {e}")
             return None
         
         if not description:
             logger.error(f"VLM returned empty description for {image_name}")
+            self._record_failure(image_path, self.vlm.last_error or "empty description")
             return None 
         logger.debug(f"Description generated for {image_name}: {description}")
 
@@ -69,41 +102,32 @@ class ImageProcessorService:
             embedding = self.embedder.encode(description)
         except Exception as e:
             logger.exception(f"Exception during embedding generation for {image_name}: {e}")
+            self._record_failure(image_path, f"embedding error: {e}")
             return None
         
         if embedding is None:
             logger.error(f"Embedding generation failed (None returned) for {image_name}")
+            self._record_failure(image_path, "embedding failed")
             return None
 
         elapsed = time.time() - start_time
         logger.info(f"Completed: {image_name} in {elapsed:.2f}s")
         logger.debug(f"Embedding shape for {image_name}: {getattr(embedding, 'shape', 'unknown')}")
 
+        if self.retry_queue is not None:
+            self.retry_queue.record_success(image_path)
 
-        return {
+        result = {
             "path": image_path,
             "filename": image_name,
             "description": description,
-            "embedding": embedding.tolist()  # serialized for JSON writing
+            "embedding": embedding.tolist(),  # serialized for JSON writing
+            "embedder_model": self.embedder.model_id,
+            "embedding_dim": len(embedding),
+            "tier": "full"
         }
-
-
-    def process_images(self, image_paths: List[str]) -> List[Dict]:
-        logger.info(f"Batch processing started. Total images: {len(image_paths)}")
-        results = []
-
-        with tqdm(total=len(image_paths), desc="Processing images", unit="img") as pbar:
-            for idx, path in enumerate(image_paths, start=1):
-                pbar.set_description(f"Processing {Path(path).name}")
-                logger.debug(f"Batch step {idx}/{len(image_paths)} -> {path}")
-
-                result = self.process_image(path)
-                if result:
-                    results.append(result)
-                    logger.debug(f"Successfully processed: {path}")
-                else:
-                    logger.warning(f"Failed to process: {path}")
-                pbar.update(1)
-
-        logger.info(f"Batch processing completed -> {len(results)}/{len(image_paths)} successful")
-        return results
+        if phash is not None:
+            result["phash"] = f"{phash:016x}"
+        if self.dedup is not None:
+            self.dedup.add(phash, result, elapsed)
+        return result
@@ -0,0 +1,122 @@
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+from config import config
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class OnnxSentenceEncoder:
+    """
+    Lightweight drop-in for SentenceTransformer backed by ONNX Runtime.
+    Loads an exported (fp32 or int8 quantized) MiniLM from a local
+    directory, so it works offline and without torch.
+    """
+
+    def __init__(
+            self,
+            model_dir: Union[str, Path],
+            model_file: str,
+            max_seq_length: int = 256,
+            n_threads: Optional[int] = None
+    ):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "ONNX embedder backend requires 'onnxruntime' and 'tokenizers'. "
+                "Install them with: pip install onnxruntime tokenizers"
+            ) from e
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / model_file
+        tokenizer_path = model_dir / "tokenizer.json"
+
+        for required in (model_path, tokenizer_path):
+            if not required.exists():
+                raise FileNotFoundError(f"ONNX embedder file missing: {required}")
+
+        self.max_seq_length = max_seq_length
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.no_padding()
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if n_threads:
+            opts.intra_op_num_threads = n_threads
+
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=opts,
+            providers=["CPUExecutionProvider"]
+        )
+
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        output_names = [o.name for o in self.session.get_outputs()]
+        # Some exports ship a pooled output; otherwise mean-pool token embeddings
+        self._pooled_output = "sentence_embedding" if "sentence_embedding" in output_names else None
+
+        logger.debug(f"ONNX session ready: {model_path} | inputs={sorted(self._input_names)}")
+
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        return [len(enc.ids) for enc in self.tokenizer.encode_batch(texts)]
+
+
+    def _encode_chunk(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        max_len = max(len(enc.ids) for enc in encodings)
+
+        input_ids = np.zeros((len(encodings), max_len), dtype=np.int64)
+        attention_mask = np.zeros_like(input_ids)
+        for row, enc in enumerate(encodings):
+            input_ids[row, :len(enc.ids)] = enc.ids
+            attention_mask[row, :len(enc.ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        if self._pooled_output:
+            return self.session.run([self._pooled_output], feeds)[0].astype(np.float32)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens, same as the MiniLM pipeline
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        return (summed / counts).astype(np.float32)
+
+
+    def encode(
+            self,
+            sentences: Union[str, List[str]],
+            batch_size: int = 32,
+            convert_to_numpy: bool = True,
+            show_progress_bar: bool = False
+    ) -> np.ndarray:
+        """
+        Mirrors the subset of SentenceTransformer.encode used by EmbedderService.
+        Returns (D,) for a single string and (N, D) for a list.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        if not texts:
+            return np.empty((0, config.embedding_dim), dtype=np.float32)
+
+        chunks = [
+            self._encode_chunk(texts[i:i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ]
+        embeddings = np.vstack(chunks)
+
+        return embeddings[0] if single else embeddings
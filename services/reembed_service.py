@@ -0,0 +1,93 @@
+from typing import Dict, List, Any, Tuple
+import time
+
+from tqdm import tqdm
+
+from services.embedder_service import EmbedderService, vector_model
+from utils.json_db import JsonDatabase
+
+from config import config
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class ReembedService:
+    """
+    Rewrites stored embeddings after the embedder model changes.
+    Only the stored descriptions are re-encoded; the VLM is never called.
+
+    Merged records are streamed (JsonDatabase.iter_merged) and new vectors
+    are appended as partial entries ({path, embedding, embedder_model,
+    embedding_dim}) that merge over the old record. A record is stale when
+    the vector it ends up with is (see vector_model), so an interrupted run
+    resumes where it stopped, and the background upgrade worker can keep
+    appending meanwhile.
+    """
+
+    def __init__(self, embedder: EmbedderService, db: JsonDatabase = None):
+        self.embedder = embedder
+        self.db = db or JsonDatabase()
+
+    def is_stale(self, record: Dict[str, Any]) -> bool:
+        """
+        record: merged record (see JsonDatabase.iter_merged).
+        """
+        model = vector_model(record)
+        return model is not None and model != self.embedder.model_id
+
+    def _flush(self, chunk: List[Tuple[str, str]]) -> int:
+        embeddings = self.embedder.encode_batch([description for _, description in chunk])
+
+        updates = []
+        for (path, _), emb in zip(chunk, embeddings):
+            if emb is None:
+                logger.warning(f"Re-embed failed, keeping old vector: {path}")
+                continue
+            updates.append({
+                "path": path,
+                "embedding": emb.tolist(),
+                "embedder_model": self.embedder.model_id,
+                "embedding_dim": len(emb),
+            })
+
+        self.db.append_records(updates)
+        return len(updates)
+
+    def run(self) -> int:
+        """
+        Re-embeds every stale record.
+        Returns the number of vectors written.
+        """
+        # Counting first costs a second DB pass but gives an honest progress bar
+        total = sum(1 for record in self.db.iter_merged() if self.is_stale(record))
+
+        if not total:
+            logger.info(f"All records already use {self.embedder.model_id}.")
+            return 0
+
+        logger.info(f"Re-embedding {total} records with {self.embedder.model_id}")
+        start = time.time()
+
+        updated = 0
+        chunk: List[Tuple[str, str]] = []
+
+        with tqdm(total=total, desc="Re-embedding", unit="rec") as pbar:
+            for record in self.db.iter_merged():
+                if not self.is_stale(record):
+                    continue
+
+                chunk.append((record["path"], record["description"]))
+                if len(chunk) >= config.reembed_chunk_size:
+                    updated += self._flush(chunk)
+                    pbar.update(len(chunk))
+                    chunk = []
+
+            if chunk:
+                updated += self._flush(chunk)
+                pbar.update(len(chunk))
+
+        elapsed = time.time() - start
+        logger.info(f"Re-embedding completed: {updated}/{total} records in {elapsed:.2f}s")
+        return updated
@@ -0,0 +1,267 @@
+import heapq
+import itertools
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Iterator, Tuple
+
+from services.image_processor_service import ImageProcessorService
+from utils.json_db import JsonDatabase
+from utils.prefetch import ImagePrefetcher
+
+from config import config
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# Queue key for the job that replays failed images whose backoff has elapsed
+RETRY_KEY = "<retry>"
+
+
+class UpgradeQueue:
+    """
+    Background worker that upgrades metadata-only records with VLM
+    descriptions and embeddings. Images in higher-priority folders are
+    described first; priorities can be changed while the queue runs.
+    Each queued folder is a lazy stream of paths, so memory does not
+    grow with the number of images waiting.
+    """
+
+    def __init__(self, processor: ImageProcessorService, db: JsonDatabase = None):
+        self.processor = processor
+        self.db = db or JsonDatabase()
+        self.retry_queue = processor.retry_queue
+        self.prefetcher = ImagePrefetcher() if config.prefetch_enabled else None
+
+        self.folder_priorities: Dict[str, int] = {
+            str(Path(folder).resolve()): priority
+            for folder, priority in config.folder_priorities.items()
+        }
+
+        # Entries: (-priority, sequence, folder, iterator of (path, read path));
+        # sequence keeps FIFO order between folders of equal priority
+        self._heap: List[tuple] = []
+        self._queued = set()
+        # Folder whose stream the worker is advancing outside the lock, and a
+        # re-enqueue of it that arrived meanwhile (used only if that stream ended)
+        self._advancing: Optional[str] = None
+        self._deferred: Dict[str, Iterator[str]] = {}
+        self._counter = itertools.count()
+        self._cv = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.completed = 0
+        self.failed = 0
+
+
+    def priority_for(self, folder: str) -> int:
+        """
+        Priority of the folder or its closest configured ancestor (default 0).
+        """
+        if folder == RETRY_KEY:
+            return config.retry_priority
+
+        resolved = Path(folder).resolve()
+        for parent in [resolved, *resolved.parents]:
+            priority = self.folder_priorities.get(str(parent))
+            if priority is not None:
+                return priority
+        return 0
+
+
+    def set_folder_priority(self, folder: str, priority: int):
+        with self._cv:
+            self.folder_priorities[str(Path(folder).resolve())] = priority
+            self._heap = [
+                (-self.priority_for(queued), seq, queued, paths)
+                for _, seq, queued, paths in self._heap
+            ]
+            heapq.heapify(self._heap)
+        logger.info(f"Folder priority set: {folder} -> {priority}")
+
+
+    def enqueue(self, folder: str, image_paths: Iterator[str]):
+        """
+        Queues a folder whose images (streamed from image_paths) need
+        VLM descriptions. A folder already in the queue is not added twice.
+        """
+        key = str(Path(folder).resolve())
+        if self._push(key, image_paths):
+            logger.info(f"Queued folder for VLM upgrade: {folder} (queued folders: {self.pending()})")
+        else:
+            logger.info(f"Folder already queued for VLM upgrade: {folder}")
+
+
+    def _push(self, key: str, image_paths: Iterator[str]) -> bool:
+        with self._cv:
+            if key in self._queued:
+                if key == self._advancing:
+                    self._deferred[key] = image_paths
+                return False
+            if self.prefetcher is not None:
+                items = self.prefetcher.wrap(image_paths)
+            else:
+                items = ((path, path) for path in image_paths)
+            heapq.heappush(self._heap, (-self.priority_for(key), next(self._counter), key, items))
+            self._queued.add(key)
+            self._cv.notify()
+        return True
+
+
+    def _schedule_retries(self):
+        if self.retry_queue is None:
+            return
+        due = self.retry_queue.due()
+        if due and self._push(RETRY_KEY, iter(due)):
+            logger.info(f"Retrying {len(due)} previously failed images.")
+
+
+    def pending(self) -> int:
+        """
+        Number of folders with images still waiting for descriptions.
+        """
+        return len(self._heap)
+
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="vlm-upgrade", daemon=True)
+        self._thread.start()
+        logger.info("VLM upgrade worker started.")
+
+
+    def stop(self, wait: bool = True):
+        """
+        Stops after the image currently being described; its result is saved.
+        """
+        self._stop.set()
+        with self._cv:
+            self._cv.notify_all()
+        if wait and self._thread:
+            self._thread.join()
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        logger.info(f"VLM upgrade worker stopped (pending: {self.pending()})")
+
+
+    def _next_path(self, block: bool = True, timeout: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """
+        Next (path, read path) from the highest-priority folder. Returns None when
+        stopped, or when nothing is queued (immediately if not blocking,
+        otherwise after timeout).
+        """
+        while not self._stop.is_set():
+            with self._cv:
+                if not self._heap:
+                    if not block:
+                        return None
+                    self._cv.wait(timeout)
+                    if not self._heap:
+                        return None
+                    continue
+                # The top folder stays in place until its stream is exhausted
+                entry = self._heap[0]
+                self._advancing = entry[2]
+
+            # Advancing the stream may wait on a slow read or scan a directory;
+            # only this worker thread consumes streams, so no lock is needed
+            # and enqueue/set_folder_priority are not held up meanwhile.
+            item = next(entry[3], None)
+
+            with self._cv:
+                self._advancing = None
+                deferred = self._deferred.pop(entry[2], None)
+                if item is not None:
+                    return item
+                # A priority change may have moved it away from the top
+                self._heap = [queued for queued in self._heap if queued[1] != entry[1]]
+                heapq.heapify(self._heap)
+                self._queued.discard(entry[2])
+                if deferred is not None:
+                    self._push(entry[2], deferred)
+            logger.info(f"Folder upgrade finished: {entry[2]}")
+
+        return None
+
+
+    def _flush(self, results: List[Dict]):
+        if not results:
+            return
+        if self.db.append_to_database(results):
+            logger.info(f"Upgraded {len(results)} records with VLM descriptions.")
+        else:
+            logger.error(f"Failed to save {len(results)} upgraded records.")
+        results.clear()
+        if self.processor.dedup is not None:
+            self.processor.dedup.log_summary()
+
+
+    def _wait_for_vlm(self) -> bool:
+        """
+        After a generation the backend would not abort, waits for it to
+        exit and reloads the model. Returns False if stopped meanwhile or
+        the reload failed.
+        """
+        vlm = self.processor.vlm
+        if vlm.is_healthy():
+            return True
+
+        logger.warning("Waiting for the VLM backend to finish an abandoned generation...")
+        while not vlm.wait_idle(config.retry_poll_seconds):
+            if self._stop.is_set():
+                return False
+
+        try:
+            vlm.reload()
+        except Exception as e:
+            logger.exception(f"VLM reload failed, stopping background processing: {e}")
+            return False
+        return True
+
+
+    def _run(self):
+        results: List[Dict] = []
+
+        self._schedule_retries()
+
+        while not self._stop.is_set():
+            if not self._wait_for_vlm():
+                break
+
+            item = self._next_path(block=False)
+            if item is None:
+                # Queue drained: save what we have, then wait for new folders or due retries
+                self._flush(results)
+                self._schedule_retries()
+                item = self._next_path(timeout=config.retry_poll_seconds)
+            if item is None:
+                continue
+
+            path, read_path = item
+            try:
+                result = self.processor.process_image(path, read_path=read_path)
+            except Exception as e:
+                logger.exception(f"Upgrade failed for {path}: {e}")
+                result = None
+            finally:
+                if self.prefetcher is not None:
+                    self.prefetcher.done(read_path, path)
+
+            if result:
+                results.append(result)
+                self.completed += 1
+            else:
+                self.failed += 1
+                logger.warning(f"Upgrade failed, record stays metadata-only: {path}")
+
+            if len(results) >= config.upgrade_flush_every:
+                self._flush(results)
+
+        self._flush(results)
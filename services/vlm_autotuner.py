@@ -0,0 +1,120 @@
+import os
+import time
+from typing import Dict, List, Optional, Any
+
+from services.vlm_service import VLMService
+from utils.vlm_profile import save_host_profile, host_key
+
+from config import config
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class VLMAutotuner:
+    """
+    Finds fast VLM thread/batch settings for the current host by running
+    a few calibration images per candidate. Parameters are tuned one at a
+    time (threads, batch threads, batch, micro-batch), keeping the best
+    value of each before moving on, so the number of model loads stays
+    around a dozen instead of the full grid product.
+    """
+
+    def __init__(self, calibration_paths: List[str]):
+        if len(calibration_paths) < 2:
+            raise ValueError("Autotuning needs at least 2 calibration images (1 warm-up + 1 measured).")
+        self.calibration_paths = calibration_paths
+        self.trials: List[Dict[str, Any]] = []
+
+
+    @staticmethod
+    def _thread_candidates() -> List[int]:
+        if config.autotune_threads:
+            return sorted(set(config.autotune_threads))
+        cpus = os.cpu_count() or 4
+        return sorted({max(1, cpus * k // 4) for k in (1, 2, 3, 4)})
+
+
+    def _measure(self, params: Dict[str, int]) -> Optional[Dict[str, float]]:
+        """
+        Loads the model with params and describes the calibration images.
+        The first image warms caches and is not timed.
+        """
+        logger.info(f"Autotune trial: {params}")
+        try:
+            vlm = VLMService(params=params)
+        except Exception as e:
+            logger.error(f"Autotune trial failed to load {params}: {e}")
+            return None
+
+        try:
+            return self._run_trial(vlm, params)
+        finally:
+            # A generation the backend would not abort must exit before the
+            # next trial loads another model next to it
+            if not vlm.is_healthy():
+                logger.warning(f"Waiting for an abandoned generation of trial {params} to exit...")
+                vlm.wait_idle()
+
+
+    def _run_trial(self, vlm: VLMService, params: Dict[str, int]) -> Optional[Dict[str, float]]:
+        vlm.generate_description(self.calibration_paths[0])
+
+        tokens = 0
+        gen_seconds = 0.0
+        start = time.monotonic()
+        for path in self.calibration_paths[1:]:
+            if vlm.generate_description(path) is None:
+                logger.warning(f"Autotune trial {params} failed on {path}: {vlm.last_error}")
+                return None
+            tokens += vlm.last_generation_stats.get("tokens", 0)
+            gen_seconds += vlm.last_generation_stats.get("seconds", 0.0)
+        elapsed = time.monotonic() - start
+
+        measured = len(self.calibration_paths) - 1
+        metrics = {
+            "images_per_sec": measured / elapsed if elapsed else 0.0,
+            "tokens_per_sec": tokens / gen_seconds if gen_seconds else 0.0,
+        }
+        self.trials.append({"params": dict(params), **metrics})
+        logger.info(f"Autotune result: {params} -> {metrics['images_per_sec']:.3f} img/s, "
+                    f"{metrics['tokens_per_sec']:.1f} tok/s")
+        return metrics
+
+
+    def run(self, save: bool = True) -> Dict[str, Any]:
+        best = {
+            "n_threads": config.vlm_n_threads or os.cpu_count() or 4,
+            "n_threads_batch": config.vlm_n_threads_batch or os.cpu_count() or 4,
+            "n_batch": config.vlm_n_batch,
+            "n_ubatch": config.vlm_n_ubatch,
+        }
+        best_metrics = self._measure(best)
+        if best_metrics is None:
+            raise RuntimeError("Autotune baseline trial failed. Check the calibration images and logs.")
+
+        threads = self._thread_candidates()
+        search_space = [
+            ("n_threads", threads),
+            ("n_threads_batch", threads),
+            ("n_batch", config.autotune_batch_sizes),
+            ("n_ubatch", lambda p: sorted({b for b in config.autotune_batch_sizes if b <= p["n_batch"]})),
+        ]
+
+        for name, values in search_space:
+            candidates = values(best) if callable(values) else values
+            for value in candidates:
+                if value == best[name]:
+                    continue
+                params = {**best, name: value}
+                metrics = self._measure(params)
+                if metrics and metrics["images_per_sec"] > best_metrics["images_per_sec"]:
+                    best, best_metrics = params, metrics
+
+        logger.info(f"Autotune best for {host_key()}: {best} -> {best_metrics}")
+
+        if save:
+            save_host_profile(best, best_metrics)
+
+        return {"params": best, "metrics": best_metrics, "trials": self.trials}
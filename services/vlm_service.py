@@ -1,6 +1,9 @@
 from pathlib import Path
 from typing import Optional, List, Tuple, Dict
 import io
+import queue
+import threading
+import time
 
 from nexaai import VLM
 from nexaai.common import (
@@ -10,16 +13,36 @@ from nexaai.common import (
     MultiModalMessageContent
 )
 
+from utils.vlm_profile import load_host_profile, host_key
 from logger import get_logger
 from config import config
 
 
 logger = get_logger(__name__)
 
+# Marks the end of the token stream produced by the generation thread
+_STREAM_END = object()
+
+
+class GenerationTimeout(Exception):
+    """Raised when the watchdog aborts a generation."""
+
+
 class VLMService:
-    def __init__(self):
+    def __init__(self, params: Optional[Dict[str, int]] = None):
+        """
+        params: explicit ModelConfig overrides (n_threads, n_batch, ...).
+        Defaults to the tuned profile for this host, then config values.
+        """
         logger.debug("Initializing VLMService...")
         self.model: Optional[VLM] = None
+        self.params = params
+        # Outcome of the latest generate_description call
+        self.last_error: Optional[str] = None
+        self.last_generation_stats: Dict[str, float] = {}
+        # Generation thread left running when the backend ignored an abort;
+        # the service is unusable until it exits (see is_healthy, reload)
+        self._abandoned: Optional[threading.Thread] = None
         self._load_model()
         logger.debug("VLMService initialized.")
 
@@ -30,10 +53,7 @@ class VLMService:
             m_cfg = ModelConfig(
                 n_gpu_layers=config.gpu_layers,
                 n_ctx=config.vlm_n_ctx,
-                n_threads=config.vlm_n_threads,
-                n_threads_batch=config.vlm_n_threads_batch,
-                n_batch=config.vlm_n_batch,
-                n_ubatch=config.vlm_n_ubatch
+                **self._resolve_params()
             )
             logger.info(f"ModelConfig: {m_cfg}")
 
@@ -53,6 +73,47 @@ class VLMService:
             raise RuntimeError(f"VLM model loading failed. {e}")
         
 
+    def is_healthy(self) -> bool:
+        return self._abandoned is None or not self._abandoned.is_alive()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for an abandoned generation to exit.
+        Returns True once the backend is idle.
+        """
+        if self._abandoned is not None:
+            self._abandoned.join(timeout)
+        return self.is_healthy()
+
+    def reload(self):
+        """
+        Replaces the model after an abandoned generation has exited, so the
+        backend never holds two models or runs two generations at once.
+        """
+        if not self.is_healthy():
+            raise RuntimeError("VLM backend is still running an abandoned generation")
+        self.vlm = None  # release the old model before loading the new one
+        self._abandoned = None
+        self._load_model()
+
+    def _resolve_params(self) -> Dict[str, Optional[int]]:
+        params = {
+            "n_threads": config.vlm_n_threads,
+            "n_threads_batch": config.vlm_n_threads_batch,
+            "n_batch": config.vlm_n_batch,
+            "n_ubatch": config.vlm_n_ubatch,
+        }
+
+        if self.params is not None:
+            params.update(self.params)
+        elif config.vlm_use_host_profile:
+            profile = load_host_profile()
+            if profile:
+                logger.info(f"Using tuned VLM profile for {host_key()}: {profile}")
+                params.update(profile)
+
+        return params
+
     # State Reset
     def _reset_state(self):
         """
@@ -94,13 +155,106 @@ class VLMService:
         
         return valid_paths, invalid_paths
 
+    @staticmethod
+    def _watchdog_reason(start: float, last_token: float, n_tokens: int, now: float) -> Optional[str]:
+        """
+        Returns why generation should be aborted, or None if it looks healthy.
+        A limit set to 0 is disabled.
+        """
+        elapsed = now - start
+
+        if config.vlm_timeout_seconds and elapsed > config.vlm_timeout_seconds:
+            return f"wall-clock limit of {config.vlm_timeout_seconds}s exceeded"
+
+        if config.vlm_stall_seconds and now - last_token > config.vlm_stall_seconds:
+            return f"no token for {now - last_token:.1f}s"
+
+        if (config.vlm_min_tokens_per_sec and n_tokens
+                and elapsed > config.vlm_rate_grace_seconds
+                and n_tokens / elapsed < config.vlm_min_tokens_per_sec):
+            return f"token rate {n_tokens / elapsed:.2f}/s below {config.vlm_min_tokens_per_sec}/s"
+
+        return None
+
+    def _generate_with_watchdog(self, formatted_prompt, g_cfg: GenerationConfig, image_path: str) -> str:
+        """
+        Streams tokens on a helper thread so a hung or runaway generation
+        can be abandoned from here once a watchdog limit is hit.
+        """
+        tokens: queue.Queue = queue.Queue()
+        cancel = threading.Event()
+
+        def produce():
+            try:
+                for token in self.vlm.generate_stream(formatted_prompt, g_cfg=g_cfg):
+                    if cancel.is_set():
+                        break
+                    tokens.put(token)
+            except Exception as e:
+                tokens.put(e)
+            finally:
+                tokens.put(_STREAM_END)
+
+        worker = threading.Thread(target=produce, name="vlm-generate", daemon=True)
+        worker.start()
+
+        buffer = io.StringIO()
+        n_tokens = 0
+        start = last_token = time.monotonic()
+
+        while True:
+            reason = self._watchdog_reason(start, last_token, n_tokens, time.monotonic())
+            if reason:
+                cancel.set()
+                worker.join(config.vlm_abort_grace_seconds)
+                if worker.is_alive():
+                    # Backend ignored the cancel. Reloading now would keep a second
+                    # model resident next to the running generation; the caller
+                    # waits for it to exit (wait_idle) and then calls reload().
+                    logger.error(f"VLM backend unresponsive after abort, service unavailable "
+                                 f"until the generation exits: {image_path}")
+                    self._abandoned = worker
+                raise GenerationTimeout(reason)
+
+            try:
+                item = tokens.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            buffer.write(item)
+            n_tokens += 1
+            last_token = time.monotonic()
+
+        elapsed = time.monotonic() - start
+        self.last_generation_stats = {
+            "tokens": n_tokens,
+            "seconds": elapsed,
+            "tokens_per_sec": n_tokens / elapsed if elapsed else 0.0
+        }
+        return buffer.getvalue()
+
     def generate_description(self, image_path: str) -> Optional[str]:
+        self.last_error = None
+        self.last_generation_stats = {}
+
         if not self.vlm:
             logger.error("VLM not initialized.")
+            self.last_error = "VLM not initialized"
+            return None
+
+        if not self.is_healthy():
+            logger.error("VLM backend is still running an abandoned generation.")
+            self.last_error = "VLM busy with an abandoned generation"
             return None
 
         if not Path(image_path).exists():
             logger.warning(f"Image missing: {image_path}")
+            self.last_error = "image missing"
             return None
         
         logger.info(f"Processing image: {image_path}")
@@ -129,33 +283,36 @@ class VLMService:
             formatted_prompt = self.vlm.apply_chat_template(conversation)
 
             # Streaming generation
-            buffer = io.StringIO()
             logger.debug(f"Generating tokens for: {image_path}")
 
-
-            for token in self.vlm.generate_stream(
+            description = self._generate_with_watchdog(
                 formatted_prompt,
-                g_cfg=GenerationConfig(
+                GenerationConfig(
                     max_tokens=config.max_tokens,
                     image_paths=[image_path]
-                )
-            ):
-                buffer.write(token)
-
-            description = buffer.getvalue().strip()
+                ),
+                image_path
+            ).strip()
 
             if not description:
                 logger.warning(f"No description generated: {image_path}")
+                self.last_error = "empty description"
                 return None
 
             logger.info(f"Description generated: {image_path}")
-            logger.debug(f"Output length: {len(description)} chars")
+            logger.debug(f"Output length: {len(description)} chars | stats: {self.last_generation_stats}")
 
             return description
 
+        except GenerationTimeout as e:
+            logger.error(f"Generation aborted by watchdog for {image_path}: {e}")
+            self.last_error = f"timeout: {e}"
+            return None
+
         except Exception as e:
             logger.error(f"Generation failed for {image_path}: {e}")
             logger.debug("Traceback:", exc_info=True)
+            self.last_error = f"error: {e}"
             return None
         
     def generate_descriptions_batch(self, image_paths: List[str]) -> Dict[str, Optional[str]]:
@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Modules are imported from the repository root (as app.py does)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import config  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    JsonDatabase in a temp dir, without fsync and with small segments.
+    """
+    from utils.json_db import JsonDatabase
+
+    monkeypatch.setattr(config, "db_fsync", False)
+    monkeypatch.setattr(config, "db_segment_max_bytes", 4096)
+    monkeypatch.setattr(config, "db_compact_threshold_bytes", 1 << 40)  # compact only when asked
+    return JsonDatabase(str(tmp_path / "image_database.json"))
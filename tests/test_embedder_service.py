@@ -0,0 +1,59 @@
+import numpy as np
+
+from config import config
+from services.embedder_service import EmbedderService
+
+
+class FakeModel:
+    """
+    Encodes a text as [number of words, position of the text in TEXTS, 1, ...]
+    and fails on texts containing "BAD".
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.calls = []
+
+    def token_lengths(self, texts):
+        return [len(t.split()) + 2 for t in texts]
+
+    def encode(self, texts, batch_size, convert_to_numpy, show_progress_bar):
+        self.calls.append(list(texts))
+        if any("BAD" in t for t in texts):
+            raise RuntimeError("cannot encode")
+        return np.array([[len(t.split()), self.texts.index(t)] + [1.0] * (config.embedding_dim - 2)
+                         for t in texts])
+
+
+def _embedder(texts):
+    embedder = EmbedderService.__new__(EmbedderService)  # no model download
+    embedder.model = FakeModel(texts)
+    embedder.model_id = "fake"
+    return embedder
+
+
+TEXTS = ["a short one", "word " * 40, "medium length text here ok", "tiny", "word " * 20, "two words"]
+
+
+def test_buckets_by_length_and_restores_order(monkeypatch):
+    monkeypatch.setattr(config, "embedder_batch_size", 2)
+    embedder = _embedder(TEXTS)
+
+    results = embedder.encode_batch(TEXTS, normalize=False)
+
+    assert [int(r[1]) for r in results] == list(range(len(TEXTS)))
+    assert all(len(call) <= 2 for call in embedder.model.calls)
+    # Longest texts first, so each bucket holds texts of similar length
+    lengths = [len(t.split()) for call in embedder.model.calls for t in call]
+    assert lengths == sorted(lengths, reverse=True)
+
+
+def test_failing_text_is_isolated(monkeypatch):
+    monkeypatch.setattr(config, "embedder_batch_size", 32)
+    texts = TEXTS[:3] + ["this one is BAD", ""] + TEXTS[3:]
+    embedder = _embedder(texts)
+
+    results = embedder.encode_batch(texts, normalize=False)
+
+    assert results[3] is None and results[4] is None
+    assert [int(r[1]) for i, r in enumerate(results) if i not in (3, 4)] == [0, 1, 2, 5, 6, 7]
@@ -0,0 +1,25 @@
+from utils.file_utils import build_path_indexes, iter_folder_images, iter_unprocessed_images
+
+
+def test_path_indexes_separate_pending_from_described(tmp_path):
+    folder = tmp_path / "trip"
+    folder.mkdir()
+    (folder / "sub").mkdir()
+    for name in ("a.jpg", "b.jpg", "c.jpg", "notes.txt"):
+        (folder / name).write_bytes(b"")
+    a, b, c = (str(folder / n) for n in ("a.jpg", "b.jpg", "c.jpg"))
+
+    records = [
+        {"path": a, "tier": "metadata"},
+        {"path": b, "tier": "metadata"},
+        {"path": a, "filename": "a.jpg", "description": "a dog", "embedding": [0.1], "tier": "full"},
+        {"path": a, "embedding": [0.2], "embedder_model": "m2"},  # re-embed update
+    ]
+    processed, indexed, pending_folders = build_path_indexes(records)
+
+    assert pending_folders == [str(folder)]
+    assert list(iter_folder_images(str(folder))) == [a, b, c]
+    # Pending: everything in the folder not yet described
+    assert list(iter_unprocessed_images(iter_folder_images(str(folder)), processed)) == [b, c]
+    # New metadata records only for images without any record
+    assert list(iter_unprocessed_images(iter_folder_images(str(folder)), indexed)) == [c]
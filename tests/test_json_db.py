@@ -0,0 +1,123 @@
+import json
+
+from config import config
+from utils.json_db import JsonDatabase
+
+
+def _by_path(db: JsonDatabase):
+    return {r["path"]: r for r in db.load_database()}
+
+
+def _full(path, description="a dog", model="m1"):
+    return {"path": path, "filename": path.rsplit("/", 1)[-1], "description": description,
+            "embedding": [0.1, 0.2], "embedder_model": model, "tier": "full"}
+
+
+def test_append_and_merge(db):
+    db.append_records([{"path": "/p/a.jpg", "tier": "metadata", "keywords": ["a"]},
+                       {"path": "/p/b.jpg", "tier": "metadata"}])
+    db.append_records([_full("/p/a.jpg")])
+    # Embedding-only update (re-embed) merges over the described record
+    db.append_records([{"path": "/p/a.jpg", "embedding": [0.3, 0.4], "embedder_model": "m2"}])
+    # Re-importing the folder must not hide the description
+    db.append_records([{"path": "/p/a.jpg", "tier": "metadata"}])
+
+    records = _by_path(db)
+    assert set(records) == {"/p/a.jpg", "/p/b.jpg"}
+    a = records["/p/a.jpg"]
+    assert a["description"] == "a dog"
+    assert a["embedding"] == [0.3, 0.4] and a["embedder_model"] == "m2"
+    assert a["keywords"] == ["a"] and a["tier"] == "full"
+    assert records["/p/b.jpg"]["tier"] == "metadata"
+
+
+def test_appends_roll_over_segments(db, monkeypatch):
+    monkeypatch.setattr(config, "ingest_buffer_size", 10)  # segments roll over between batches
+    db.append_records(_full(f"/p/{i}.jpg") for i in range(200))
+    assert len(db._segments()) > 1
+    assert len(db.load_database()) == 200
+
+
+def test_torn_tail_line_is_skipped_and_appends_continue(db):
+    db.append_records([_full("/p/a.jpg")])
+    segment = db._segments()[-1]
+    with segment.open("ab") as f:
+        f.write(b'{"path": "/p/torn.jpg", "descr')  # crash mid-write
+
+    assert set(_by_path(db)) == {"/p/a.jpg"}
+
+    db.append_records([_full("/p/b.jpg")])
+    assert set(_by_path(db)) == {"/p/a.jpg", "/p/b.jpg"}
+
+
+def test_legacy_json_array_is_read_and_converted_on_compaction(db):
+    legacy = [_full(f"/p/{i}.jpg", description=f"photo {i}") for i in range(50)]
+    db.db_path.write_text(json.dumps(legacy, indent=4), encoding="utf-8")
+
+    assert _by_path(db) == {r["path"]: r for r in legacy}
+
+    db.append_records([{"path": "/p/3.jpg", "embedder_model": "m2"}, _full("/p/new.jpg")])
+    before = _by_path(db)
+    assert db.compact()
+
+    assert not db._segments() or all(s.stat().st_size == 0 for s in db._segments())
+    assert not db.db_path.read_text(encoding="utf-8").lstrip().startswith("[")
+    assert _by_path(db) == before
+    assert before["/p/3.jpg"]["embedder_model"] == "m2"
+
+
+def test_compaction_matches_load(db):
+    db.append_records({"path": f"/p/{i}.jpg", "tier": "metadata"} for i in range(100))
+    db.append_records(_full(f"/p/{i}.jpg", description=f"d{i}") for i in range(0, 100, 3))
+    db.append_records({"path": f"/p/{i}.jpg", "tier": "metadata"} for i in range(0, 100, 9))
+    before = _by_path(db)
+
+    assert db.compact()
+    assert _by_path(db) == before
+    # Appends after compaction land in a new segment and still merge
+    db.append_records([_full("/p/1.jpg", description="updated")])
+    assert _by_path(db)["/p/1.jpg"]["description"] == "updated"
+
+
+def test_compaction_racing_save_database_keeps_the_save(db, monkeypatch):
+    db.append_records(_full(f"/p/{i}.jpg") for i in range(20))
+    saved = [_full("/p/saved.jpg", description="from save")]
+
+    index_entries = JsonDatabase._index_entries
+
+    def save_during_merge(self, sources):
+        result = index_entries(self, sources)
+        assert db.save_database(saved)  # rewrites the base, drops the sealed segments
+        return result
+
+    monkeypatch.setattr(JsonDatabase, "_index_entries", save_during_merge)
+
+    assert db.compact() is False
+    assert _by_path(db) == {"/p/saved.jpg": saved[0]}
+    assert not list(db.db_path.parent.glob("*.compact.tmp"))
+
+
+def test_iter_merged_matches_load(db):
+    db.append_records({"path": f"/p/{i}.jpg", "tier": "metadata"} for i in range(100))
+    db.append_records(_full(f"/p/{i}.jpg", description=f"d{i}") for i in range(0, 100, 3))
+    db.append_records({"path": f"/p/{i}.jpg", "embedder_model": "m2"} for i in range(0, 100, 6))
+    db.append_records({"path": f"/p/{i}.jpg", "tier": "metadata"} for i in range(0, 100, 9))
+
+    merged = {r["path"]: r for r in db.iter_merged()}
+    assert merged == _by_path(db)
+
+    def keep(r):
+        return r["path"].endswith("7.jpg")
+
+    assert {r["path"]: r for r in db.iter_merged(keep)} == {r["path"]: r for r in db.load_database(keep)}
+
+    db.compact()
+    assert {r["path"]: r for r in db.iter_merged()} == merged
+
+
+def test_iter_merged_reads_legacy_json_array(db):
+    legacy = [_full(f"/p/{i}.jpg", description=f"photo {i}") for i in range(5)]
+    db.db_path.write_text(json.dumps(legacy, indent=4), encoding="utf-8")
+    db.append_records([{"path": "/p/3.jpg", "embedder_model": "m2"}])
+
+    assert {r["path"]: r for r in db.iter_merged()} == _by_path(db)
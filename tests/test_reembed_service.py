@@ -0,0 +1,65 @@
+import numpy as np
+
+from config import config
+from search.search_engine import SearchEngine
+from services.reembed_service import ReembedService
+
+
+class FakeEmbedder:
+    """
+    Deterministic stand-in for EmbedderService (no model download).
+    """
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+
+    def encode_batch(self, texts):
+        return [np.full(config.embedding_dim, len(text), dtype=np.float32) for text in texts]
+
+
+def _described(path):
+    return {"path": path, "filename": path.rsplit("/", 1)[-1], "description": f"photo of {path}",
+            "embedding": [0.5] * config.embedding_dim, "embedder_model": "A",
+            "embedding_dim": config.embedding_dim, "tier": "full"}
+
+
+def _stale_in_index(db, model_id):
+    return SearchEngine(None, db=db, snapshot_name=None).count_stale(model_id)
+
+
+def test_switching_models_back_and_forth(db, monkeypatch):
+    monkeypatch.setattr(config, "embedding_dim", 4)
+    db.append_records([_described("/p/a.jpg"), _described("/p/b.jpg"), {"path": "/p/c.jpg", "tier": "metadata"}])
+
+    assert ReembedService(FakeEmbedder("A"), db).run() == 0
+    assert ReembedService(FakeEmbedder("B"), db).run() == 2
+    assert _stale_in_index(db, "B") == 0
+
+    # The oldest entries carry A, but the vectors in use are B's
+    assert _stale_in_index(db, "A") == 2
+    assert ReembedService(FakeEmbedder("A"), db).run() == 2
+    assert _stale_in_index(db, "A") == 0
+    assert {r["embedder_model"] for r in db.load_database() if r.get("description")} == {"A"}
+
+
+def test_interrupted_run_resumes(db, monkeypatch):
+    monkeypatch.setattr(config, "embedding_dim", 4)
+    monkeypatch.setattr(config, "reembed_chunk_size", 2)
+    db.append_records(_described(f"/p/{i}.jpg") for i in range(5))
+
+    calls = []
+
+    class FailingEmbedder(FakeEmbedder):
+        def encode_batch(self, texts):
+            if calls:
+                raise RuntimeError("interrupted")
+            calls.append(texts)
+            return super().encode_batch(texts)
+
+    try:
+        ReembedService(FailingEmbedder("B"), db).run()
+    except RuntimeError:
+        pass
+
+    assert ReembedService(FakeEmbedder("B"), db).run() == 3
+    assert _stale_in_index(db, "B") == 0
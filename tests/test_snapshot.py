@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from config import config
+from search.search_engine import SearchEngine
+
+
+@pytest.fixture
+def snapshot_db(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "embedding_dim", 8)
+    monkeypatch.setattr(config, "search_snapshot_enabled", True)
+    monkeypatch.setattr(config, "search_snapshot_dir", tmp_path / "snapshots")
+    # Exercise the prefilter state as well
+    monkeypatch.setattr(config, "prefilter_dim", 4)
+    monkeypatch.setattr(config, "prefilter_min_vectors", 10)
+    monkeypatch.setattr(config, "prefilter_eval_queries", 0)
+
+    rng = np.random.default_rng(0)
+    db.append_records(
+        {"path": f"/photos/trip/{i}.jpg", "filename": f"{i}.jpg", "description": f"photo number {i}",
+         "embedding": rng.standard_normal(8).tolist(), "embedder_model": "A" if i % 4 else "B",
+         "embedding_dim": 8, "tier": "full"}
+        for i in range(40)
+    )
+    db.append_records({"path": f"/photos/beach/sunset_{i}.jpg", "tier": "metadata",
+                       "keywords": ["sunset", "beach"]} for i in range(5))
+    return db
+
+
+def _queries():
+    rng = np.random.default_rng(1)
+    return [("sunset beach", rng.standard_normal(8).astype(np.float32)) for _ in range(5)]
+
+
+def _results(engine):
+    return [engine.search_encoded(text, q, top_k=10, min_similarity=-1.0) for text, q in _queries()]
+
+
+def test_snapshot_round_trip_gives_identical_results(snapshot_db):
+    built = SearchEngine(None, db=snapshot_db)
+    assert built.indexer.reduced is not None
+    assert len(list(config.search_snapshot_dir.iterdir())) == 1
+
+    mapped = SearchEngine(None, db=snapshot_db)
+    assert isinstance(mapped.store.matrix, np.memmap)
+
+    assert _results(mapped) == _results(built)
+    assert mapped.store.embedder_models == built.store.embedder_models == {"A": 30, "B": 10}
+    assert mapped.count_stale("A") == 10
+    assert [mapped.store.path(i) for i in range(len(mapped.store))] == \
+           [built.store.path(i) for i in range(len(built.store))]
+
+
+def test_snapshot_is_rebuilt_when_a_db_file_changes(snapshot_db):
+    first = SearchEngine(None, db=snapshot_db)
+    old_dirs = set(config.search_snapshot_dir.iterdir())
+
+    snapshot_db.append_records([{"path": "/photos/trip/0.jpg", "embedding": [1.0] * 8,
+                                 "embedder_model": "A", "embedding_dim": 8}])
+    rebuilt = SearchEngine(None, db=snapshot_db)
+
+    assert not isinstance(rebuilt.store.matrix, np.memmap)
+    assert rebuilt.count_stale("A") == first.count_stale("A") - 1
+    new_dirs = set(config.search_snapshot_dir.iterdir())
+    assert len(new_dirs) == 1 and new_dirs.isdisjoint(old_dirs)
@@ -0,0 +1,97 @@
+from collections import deque
+from typing import Dict, Any, Optional
+
+from PIL import Image
+
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# dHash grid: HASH_SIZE x HASH_SIZE bits from a (HASH_SIZE + 1) x HASH_SIZE thumbnail
+HASH_SIZE = 8
+
+
+def dhash(image_path: str) -> Optional[int]:
+    """
+    64-bit difference hash: compares neighbouring pixels of a tiny
+    grayscale thumbnail. Near-identical frames differ in only a few bits.
+    """
+    try:
+        with Image.open(image_path) as img:
+            img.draft("L", (HASH_SIZE * 16, HASH_SIZE * 16))  # fast JPEG downscale on decode
+            small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+            pixels = list(small.getdata())
+    except Exception as e:
+        logger.debug(f"Perceptual hash failed for {image_path}: {e}")
+        return None
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class DuplicateDetector:
+    """
+    Groups burst shots and near-identical frames before VLM processing.
+    Keeps the last dedup_window described images (representatives); an
+    image within dedup_hamming_threshold bits of one of them reuses its
+    description and embedding instead of being described again.
+    """
+
+    def __init__(self):
+        self._recent: deque = deque(maxlen=config.dedup_window)
+        self.checked = 0
+        self.duplicates = 0
+        self.vlm_seconds = 0.0
+        self.described = 0
+
+
+    def match(self, phash: Optional[int]) -> Optional[Dict[str, Any]]:
+        """
+        Returns the closest recent representative's result, or None.
+        """
+        self.checked += 1
+        if phash is None:
+            return None
+
+        best, best_distance = None, config.dedup_hamming_threshold + 1
+        for rep_hash, rep_result in self._recent:
+            distance = (phash ^ rep_hash).bit_count()
+            if distance < best_distance:
+                best, best_distance = rep_result, distance
+
+        if best is not None:
+            self.duplicates += 1
+            logger.debug(f"Near-duplicate (distance {best_distance}) of {best['path']}")
+        return best
+
+
+    def add(self, phash: Optional[int], result: Dict[str, Any], seconds: float):
+        """
+        Registers a newly described image as a representative.
+        """
+        self.described += 1
+        self.vlm_seconds += seconds
+        if phash is not None:
+            self._recent.append((phash, result))
+
+
+    def summary(self) -> Dict[str, float]:
+        avg = self.vlm_seconds / self.described if self.described else 0.0
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "vlm_calls_saved_pct": 100.0 * self.duplicates / self.checked if self.checked else 0.0,
+            "est_seconds_saved": avg * self.duplicates,
+        }
+
+
+    def log_summary(self):
+        s = self.summary()
+        if s["checked"]:
+            logger.info(f"Near-duplicates: {s['duplicates']}/{s['checked']} images reused a description "
+                        f"({s['vlm_calls_saved_pct']:.1f}% fewer VLM calls, ~{s['est_seconds_saved']:.0f}s saved)")
@@ -1,5 +1,11 @@
+import os
+import hashlib
+from array import array
+from itertools import islice
 from pathlib import Path
-from typing import List
+from typing import List, Iterable, Iterator, Tuple
+
+import numpy as np
 
 from config import config
 from logger import get_logger
@@ -24,27 +30,35 @@ def is_valid_image(path: Path) -> bool:
     return True
 
 
-def scan_image_folder(folder_path: str) -> List[str]:
+def iter_image_folder(folder_path: str) -> Iterator[str]:
     """
     Recursively scans a folder for valid images.
-    Returns a list of full file paths.
+    Yields full file paths directory by directory, sorted by name within
+    each directory so burst shots arrive next to each other.
     """
     folder = Path(folder_path)
 
     if not folder.exists():
         logger.error(f"Folder not found: {folder}")
-        return []
+        return
 
     if not folder.is_dir():
         logger.error(f"Expected directory, got file: {folder}")
-        return []
+        return
 
-    images = []
+    for root, dirs, files in os.walk(folder):  # recursive
+        dirs.sort()
+        for name in sorted(files):
+            if Path(name).suffix.lower() in config.allowed_extensions:
+                yield os.path.join(root, name)
 
-    for file in folder.rglob("*"):  # recursive
-        if file.suffix.lower() in config.allowed_extensions:
-            images.append(str(file))
 
+def scan_image_folder(folder_path: str) -> List[str]:
+    """
+    Recursively scans a folder for valid images.
+    Returns a list of full file paths.
+    """
+    images = list(iter_image_folder(folder_path))
     logger.info(f"Found {len(images)} images in {folder_path}")
     return images
 
@@ -58,42 +72,76 @@ def ensure_directory(path: str):
     logger.debug(f"Ensured directory: {p}")
 
 
-def filter_existing_images(
-        image_paths: List[str],
-        existing_db: List[dict]
-) -> List[str]:
+def path_digest(path: str) -> int:
     """
-    Filters out images that are already present in the existing database.
-    And check if processed and saved in db correctly.
+    64-bit digest of the resolved path, used instead of the path string
+    to keep the processed-image index small.
     """
-    # Normalize incoming image paths to absolute resolved strings
-    incoming_resolved = {str(Path(p).resolve()) for p in image_paths}
+    resolved = str(Path(path).resolve()).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(resolved, digest_size=8).digest(), "little")
 
-    # Build set of validated processed paths from DB records
-    processed_resolved = set()
-    for record in existing_db:
-        try:
-            if json_db.valid_db_record(record):
-                rp = record.get("path")
-                if rp:
-                    processed_resolved.add(str(Path(rp).resolve()))
-        except Exception:
-            logger.debug(f"Skipping invalid DB record during filtering: {record}")
 
-    # Filter out any image whose resolved path is already in processed_resolved
-    filtered = [p for p in image_paths if str(Path(p).resolve()) not in processed_resolved]
-
-    logger.info(f"Filtered images: {len(image_paths)} -> {len(filtered)} (existing: {len(processed_resolved)})")
-    return filtered
-
-def fetch_processed_images_paths(
-        existing_db: List[dict]
-) -> List[str]:
+def build_path_indexes(records: Iterable[dict]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
     """
-    Fetches the list of image paths that have already been processed
-    and are present in the existing database.
+    One pass over the (streamed) DB. Returns sorted path digests of fully
+    processed records and of every indexed record (8 bytes per image
+    each), plus the folders holding metadata-only records.
     """
-    processed_paths = [record["path"] for record in existing_db]
-
-    logger.info(f"Fetched {len(processed_paths)} processed image paths from database.")
-    return processed_paths
\ No newline at end of file
+    processed, indexed = array("Q"), array("Q")
+    pending_folders = set()
+
+    for r in records:
+        if not r.get("path"):
+            continue
+        digest = path_digest(r["path"])
+        indexed.append(digest)
+        if r.get("tier") == "metadata":
+            pending_folders.add(os.path.dirname(r["path"]))
+        # Embedding-only updates (re-embed) carry no description; skip them quietly
+        elif "description" in r and json_db.valid_db_record(r):
+            processed.append(digest)
+
+    processed_index = np.unique(np.frombuffer(processed, dtype=np.uint64))
+    indexed_index = np.unique(np.frombuffer(indexed, dtype=np.uint64))
+    logger.info(f"Path indexes built: {len(processed_index)} processed, {len(indexed_index)} indexed images")
+    return processed_index, indexed_index, sorted(pending_folders)
+
+
+def iter_folder_images(folder_path: str) -> Iterator[str]:
+    """
+    Images directly in a folder (not recursive), sorted by name.
+    """
+    try:
+        names = sorted(os.listdir(folder_path))
+    except OSError as e:
+        logger.warning(f"Cannot list folder {folder_path}: {e}")
+        return
+
+    for name in names:
+        path = os.path.join(folder_path, name)
+        if Path(name).suffix.lower() in config.allowed_extensions and os.path.isfile(path):
+            yield path
+
+
+def iter_unprocessed_images(
+        image_paths: Iterable[str],
+        processed_index: np.ndarray
+) -> Iterator[str]:
+    """
+    Streams image paths not present in processed_index,
+    checking them in batches of ingest_buffer_size.
+    """
+    paths = iter(image_paths)
+    while True:
+        batch = list(islice(paths, config.ingest_buffer_size))
+        if not batch:
+            return
+
+        digests = np.fromiter((path_digest(p) for p in batch), dtype=np.uint64, count=len(batch))
+        pos = np.searchsorted(processed_index, digests)
+        pos[pos == len(processed_index)] = 0
+        seen = processed_index[pos] == digests if len(processed_index) else np.zeros(len(batch), dtype=bool)
+
+        for path, done in zip(batch, seen):
+            if not done:
+                yield path
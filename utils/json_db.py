@@ -1,41 +1,280 @@
+import hashlib
+import io
 import json
+import os
+import re
+import threading
+from array import array
+from contextlib import ExitStack
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Callable, Optional, IO, Tuple
+
+import numpy as np
 
 from config import config
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+# Chunk size for streaming reads of legacy JSON-array files
+READ_CHUNK = 1 << 20
+_SKIP_RE = re.compile(r"[\s,]*")
+_SEGMENT_RE = re.compile(r"\.seg-(\d{6})$")
+
+
+def _path_key(path: str) -> int:
+    """
+    64-bit key of the exact stored path string (merge and compaction index).
+    """
+    return int.from_bytes(hashlib.blake2b(path.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _fsync_dir(directory: Path):
+    """
+    Persists renames/creations in directory (no-op where unsupported, e.g. Windows).
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path: Path, data: Any):
+    """
+    Writes a small JSON file via a fsynced temp file and a rename, so a
+    crash leaves either the old or the new contents, never a torn file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+
+
 class JsonDatabase:
+    """
+    Record store on disk: a compacted base file plus append-only log segments.
+
+    - base (db_path): one JSON record per line; legacy JSON-array files are still read
+    - segments (<db_path>.seg-NNNNNN): new and updated records, appended in
+      batches with one fsync per batch
+    - compaction merges base + closed segments into a temp file in two
+      streaming passes (index of path keys, then merged write), fsyncs it and
+      atomically renames it over the base, then deletes the merged segments
+
+    Later entries for a path update earlier ones. A crash can at most leave a
+    torn last line in the newest segment, which is skipped on read.
+    """
+
+    # Shared by all instances: the background upgrade worker and the
+    # CLI flows read and write the same files from different threads.
+    _lock = threading.RLock()
+    _compacting = threading.Event()
+
     def __init__(self, db_path: str = None):
         self.db_path = Path(db_path or config.db_path)
 
 
+    # ---- Layout ----
+
+    def _segments(self) -> List[Path]:
+        """
+        Log segments, oldest first.
+        """
+        prefix = self.db_path.name + ".seg-"
+        if not self.db_path.parent.exists():
+            return []
+        found = [
+            p for p in self.db_path.parent.iterdir()
+            if p.name.startswith(prefix) and _SEGMENT_RE.search(p.name)
+        ]
+        return sorted(found, key=lambda p: p.name)
+
+
+    def _segment_path(self, number: int) -> Path:
+        return self.db_path.with_name(f"{self.db_path.name}.seg-{number:06d}")
+
+
+    def _active_segment(self) -> Path:
+        """
+        Newest segment, or a new one if it is full (or none exists).
+        """
+        segments = self._segments()
+        if segments and segments[-1].stat().st_size < config.db_segment_max_bytes:
+            return segments[-1]
+        number = int(_SEGMENT_RE.search(segments[-1].name).group(1)) + 1 if segments else 1
+        return self._segment_path(number)
+
+
+    def exists(self) -> bool:
+        return self.db_path.exists() or bool(self._segments())
+
+
+    # ---- Reading ----
+
+    @staticmethod
+    def _iter_json_array(f: IO[str], source: Path) -> Iterator[Dict[str, Any]]:
+        """
+        Streams records from a legacy pretty-printed JSON array.
+        """
+        decoder = json.JSONDecoder()
+        buf = f.read(READ_CHUNK).lstrip()[1:]  # drop '['
+
+        while True:
+            pos = 0
+            while True:
+                pos = _SKIP_RE.match(buf, pos).end()
+                if pos < len(buf) and buf[pos] == "]":
+                    return
+                try:
+                    record, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # record continues in the next chunk
+                yield record
+
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                raise json.JSONDecodeError(f"Unexpected end of DB file {source}", buf, pos)
+            buf = buf[pos:] + chunk
+
+
+    @staticmethod
+    def _iter_json_lines(f: IO[bytes], source: Path, limit: int) -> Iterator[Dict[str, Any]]:
+        """
+        Reads lines up to byte limit (the size when the file was opened), so
+        a batch being appended concurrently is never seen half-written.
+        """
+        offset = 0
+        for line_no, line in enumerate(f, start=1):
+            offset += len(line)
+            if offset > limit:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                # Torn tail after a crash, or a damaged line: lose only this record
+                logger.warning(f"Skipping unreadable DB line {source.name}:{line_no}: {e}")
+
+
+    def _iter_file(self, f: IO[bytes], source: Path, limit: int) -> Iterator[Dict[str, Any]]:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if not head:
+            return
+        f.seek(0)
+        if head == b"[":
+            yield from self._iter_json_array(io.TextIOWrapper(f, encoding="utf-8"), source)
+        else:
+            yield from self._iter_json_lines(f, source, limit)
 
 
-    def load_database(self) -> List[Dict[str, Any]]:
+    def file_stats(self) -> List[Tuple[str, int, int]]:
+        """
+        (name, size, mtime_ns) of the base file and every segment.
+        Changes whenever the DB contents change (cheap staleness check).
+        """
+        stats = []
+        with self._lock:
+            for source in ([self.db_path] if self.db_path.exists() else []) + self._segments():
+                try:
+                    st = source.stat()
+                except FileNotFoundError:
+                    continue
+                stats.append((source.name, st.st_size, st.st_mtime_ns))
+        return stats
+
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """
+        Streams raw records (base file, then segments oldest first) without
+        loading everything. The same path may appear more than once
+        (later entries update earlier ones, see append_records).
+        """
+
+        if not self.exists():
+            logger.warning(f"Database file not found: {self.db_path}")
+            return
+
+        with ExitStack() as stack:
+            # Open everything up front (under the lock, so sizes fall on batch
+            # boundaries) so a concurrent compaction cannot delete a segment
+            # between reading base and it. Reading then runs without the lock.
+            files = []
+            with self._lock:
+                sources = [self.db_path] if self.db_path.exists() else []
+                sources += self._segments()
+                for source in sources:
+                    try:
+                        f = stack.enter_context(source.open("rb"))
+                    except FileNotFoundError:
+                        logger.debug(f"DB file vanished before read: {source}")
+                        continue
+                    files.append((f, source, os.fstat(f.fileno()).st_size))
+
+            for f, source, limit in files:
+                yield from self._iter_file(f, source, limit)
+
+
+    def _merge(self,
+            records: Iterable[Dict[str, Any]],
+            keep: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> List[Dict[str, Any]]:
+        data: List[Dict[str, Any]] = []
+        by_path: Dict[str, int] = {}
+
+        for record in records:
+            if not isinstance(record, dict):
+                raise ValueError(f"Invalid DB format: expected records, got {type(record)}")
+            if keep is not None and not keep(record):
+                continue
+            idx = by_path.get(record.get("path"))
+            if idx is None:
+                by_path[record.get("path")] = len(data)
+                data.append(record)
+            elif not self._is_downgrade(data[idx], record):
+                data[idx].update(record)
+
+        return data
+
+
+    def load_database(self, keep: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
         """
         Loads image metadata database from JSON.
+        Entries sharing a path are merged (later fields win).
+        keep: optional filter applied while streaming (e.g. one search shard);
+        it must give the same answer for every entry of a path.
         Returns empty list if file doesn't exist.
         """
 
-        if not self.db_path.exists():
+        if not self.exists():
             logger.warning(f"Database file not found: {self.db_path}")
             return []
 
         try:
-            with self.db_path.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            if not isinstance(data, list):
-                logger.error(f"Invalid DB format: expected list, got {type(data)}")
-                return []
+            data = self._merge(self.iter_records(), keep)
 
             logger.info(f"Loaded database: {self.db_path} | {len(data)} records")
             return data
 
-        except json.JSONDecodeError as e:
+        except (json.JSONDecodeError, ValueError) as e:
             logger.error(f"Failed to parse JSON DB: {e}")
             return []
         except Exception as e:
@@ -43,20 +282,71 @@ class JsonDatabase:
             return []
 
 
+    @staticmethod
+    def _is_downgrade(current: Dict[str, Any], update: Dict[str, Any]) -> bool:
+        """
+        A metadata-only entry written after the image was already described
+        (e.g. the folder was re-imported meanwhile) must not hide the description.
+        """
+        return update.get("tier") == "metadata" and bool(current.get("description"))
+
+
+    # ---- Writing ----
+
+    @staticmethod
+    def _dumps(record: Dict[str, Any]) -> str:
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+    def _write_temp(self, lines: Iterable[bytes], suffix: str) -> Tuple[Path, int]:
+        """
+        Writes serialized records to <db_path><suffix> and fsyncs it.
+        """
+        tmp_path = self.db_path.with_name(self.db_path.name + suffix)
+        count = 0
+
+        try:
+            with tmp_path.open("wb") as f:
+                for line in lines:
+                    f.write(line + b"\n")
+                    count += 1
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        return tmp_path, count
+
+
+    def _install_base(self, tmp_path: Path):
+        """
+        Renames a finished temp file over the base file, so the base is
+        always either the old or the new version.
+        """
+        os.replace(tmp_path, self.db_path)
+        _fsync_dir(self.db_path.parent)
+
+
+    def _write_base(self, records: Iterable[Dict[str, Any]]) -> int:
+        tmp_path, count = self._write_temp((self._dumps(r).encode("utf-8") for r in records), ".tmp")
+        self._install_base(tmp_path)
+        return count
+
+
     def save_database(self, records: List[Dict[str, Any]]) -> bool:
         """
-        Saves list of records to JSON database file.
+        Saves list of records to JSON database file (atomic full rewrite;
+        existing log segments are folded in and removed).
         Returns True if success, False otherwise.
         """
 
         try:
-            with self.db_path.open("w", encoding="utf-8") as f:
-                json.dump(
-                    records,
-                    f,
-                    indent=2,
-                    ensure_ascii=False
-                )
+            with self._lock:
+                segments = self._segments()
+                self._write_base(records)
+                for segment in segments:
+                    segment.unlink()
 
             logger.info(f"Saved {len(records)} records to DB: {self.db_path}")
             return True
@@ -65,12 +355,299 @@ class JsonDatabase:
             logger.error(f"Failed to save DB: {e}")
             return False
 
+    def append_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Streams records onto the active log segment without reading the
+        existing ones. Writes in batches of ingest_buffer_size with one
+        fsync per batch, taking the lock per batch so other writers are not
+        blocked for the whole stream.
+        Returns the number of records written.
+        """
+        written = 0
+        records = iter(records)
+
+        while True:
+            batch = [self._dumps(r) for r in islice(records, config.ingest_buffer_size)]
+            if not batch:
+                break
+
+            with self._lock:
+                segment = self._active_segment()
+                created = not segment.exists()
+
+                with segment.open("ab") as f:
+                    # Start on a fresh line if a previous crash left a torn one
+                    if f.tell() > 0 and not self._ends_with_newline(segment):
+                        f.write(b"\n")
+                    f.write(("\n".join(batch) + "\n").encode("utf-8"))
+                    f.flush()
+                    if config.db_fsync:
+                        os.fsync(f.fileno())
+
+                if created and config.db_fsync:
+                    _fsync_dir(self.db_path.parent)
+
+            written += len(batch)
+
+        logger.debug(f"Appended {written} records to DB: {self.db_path}")
+
+        if written:
+            self._maybe_compact()
+        return written
+
+    @staticmethod
+    def _ends_with_newline(path: Path) -> bool:
+        with path.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
     def append_to_database(self,
-            new_records: List[Dict[str, Any]]
+            new_records: Iterable[Dict[str, Any]]
     ) -> bool:
-        existing_records = self.load_database()
-        combined_records = existing_records + new_records
-        return self.save_database(combined_records)
+        try:
+            self.append_records(new_records)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to append to DB: {e}")
+            return False
+
+
+    # ---- Compaction ----
+
+    def _maybe_compact(self):
+        # Check and set together so concurrent appenders start one compaction
+        with self._lock:
+            if self._compacting.is_set():
+                return
+            if sum(s.stat().st_size for s in self._segments()) < config.db_compact_threshold_bytes:
+                return
+            self._compacting.set()
+
+        threading.Thread(target=self._compact_in_background, name="db-compact", daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            self._compacting.clear()
+
+    @staticmethod
+    def _iter_raw_lines(f: IO[bytes], limit: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+        """
+        (byte offset, line) for every non-blank line of a JSON-lines file,
+        up to byte limit if given (see _iter_json_lines).
+        """
+        f.seek(0)
+        offset = 0
+        for line in f:
+            start = offset
+            offset += len(line)
+            if limit is not None and offset > limit:
+                return
+            line = line.strip()
+            if line:
+                yield start, line
+
+
+    @staticmethod
+    def _is_json_array(f: IO[bytes]) -> bool:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        return head == b"["
+
+
+    def _index_entries(self,
+            files: List[IO[bytes]],
+            limits: Optional[List[int]] = None,
+            keep: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Merge pass 1: path key, source number and byte offset of every
+        readable entry (passing keep), in log order (about 20 bytes per entry).
+        """
+        keys, source_ids, offsets = array("Q"), array("i"), array("q")
+
+        for source_id, f in enumerate(files):
+            for offset, line in self._iter_raw_lines(f, limits[source_id] if limits else None):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Skipping unreadable DB line in {Path(f.name).name} at byte {offset}: {e}")
+                    continue
+                if not isinstance(record, dict):
+                    raise ValueError(f"Invalid DB format: expected records, got {type(record)}")
+                if keep is not None and not keep(record):
+                    continue
+                keys.append(_path_key(record.get("path") or ""))
+                source_ids.append(source_id)
+                offsets.append(offset)
+
+        return (np.frombuffer(keys, dtype=np.uint64), np.frombuffer(source_ids, dtype=np.int32),
+                np.frombuffer(offsets, dtype=np.int64))
+
+
+    def _iter_path_groups(self,
+            files: List[IO[bytes]],
+            readers: List[IO[bytes]],
+            keys: np.ndarray,
+            source_ids: np.ndarray,
+            offsets: np.ndarray,
+            limits: Optional[List[int]] = None
+    ) -> Iterator[List[bytes]]:
+        """
+        Merge pass 2: streams the entries again and yields the lines of
+        each path, in log order, at the position of its last entry. Lines
+        of paths written several times are re-read by offset (through
+        readers, a second handle per file); others come from the stream.
+        """
+        n = len(keys)
+        # Stable sort: entries of a path stay in log order
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        first = np.ones(n, dtype=bool)
+        first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        starts = np.flatnonzero(first)
+        ends = np.append(starts[1:], n)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+        groups = np.cumsum(first)[rank] - 1  # group of each entry, in log order
+        del sorted_keys, first
+
+        def read_line(entry: int) -> bytes:
+            f = readers[source_ids[entry]]
+            f.seek(int(offsets[entry]))
+            return f.readline()
+
+        entry = 0
+        for source_id, f in enumerate(files):
+            for offset, line in self._iter_raw_lines(f, limits[source_id] if limits else None):
+                if entry >= n or source_ids[entry] != source_id or offsets[entry] != offset:
+                    continue  # unreadable or filtered out in pass 1
+
+                group = groups[entry]
+                start, end = starts[group], ends[group]
+                if end - start == 1:
+                    yield [line]
+                elif rank[entry] == end - 1:
+                    yield [read_line(e) for e in order[start:end]]
+                entry += 1
+
+
+    def iter_merged(self, keep: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streams merged records (as load_database returns them, one per
+        path) without holding the DB in memory: a key/offset index of the
+        entries plus the entries of one path at a time. keep filters
+        entries as in load_database. A legacy JSON-array base (until its
+        first compaction) has no line offsets and is merged in memory.
+        """
+        if not self.exists():
+            logger.warning(f"Database file not found: {self.db_path}")
+            return
+
+        with ExitStack() as stack:
+            files, readers, limits = [], [], []
+            with self._lock:
+                # Opened (and sized) under the lock, as in iter_records
+                for source in ([self.db_path] if self.db_path.exists() else []) + self._segments():
+                    try:
+                        f = stack.enter_context(source.open("rb"))
+                    except FileNotFoundError:
+                        logger.debug(f"DB file vanished before read: {source}")
+                        continue
+                    files.append(f)
+                    readers.append(stack.enter_context(source.open("rb")))
+                    limits.append(os.fstat(f.fileno()).st_size)
+
+            if files and Path(files[0].name) == self.db_path and self._is_json_array(files[0]):
+                logger.info("Legacy JSON-array DB: merging in memory until the next compaction.")
+                yield from self._merge(self.iter_records(), keep)
+                return
+
+            keys, source_ids, offsets = self._index_entries(files, limits, keep)
+            for lines in self._iter_path_groups(files, readers, keys, source_ids, offsets, limits):
+                # _merge also separates distinct paths sharing a key
+                yield from self._merge(json.loads(line) for line in lines)
+
+
+    def _iter_compacted(self,
+            files: List[IO[bytes]],
+            readers: List[IO[bytes]],
+            keys: np.ndarray,
+            source_ids: np.ndarray,
+            offsets: np.ndarray
+    ) -> Iterator[bytes]:
+        """
+        Compacted lines: paths written once are copied verbatim, the
+        entries of paths written several times are merged.
+        """
+        for lines in self._iter_path_groups(files, readers, keys, source_ids, offsets):
+            if len(lines) == 1:
+                yield lines[0]
+            else:
+                for record in self._merge(json.loads(line) for line in lines):
+                    yield self._dumps(record).encode("utf-8")
+
+
+    def compact(self) -> bool:
+        """
+        Folds all closed segments into the base file. Appends continue
+        into a new segment while the merge runs; only the final rename
+        and segment cleanup take the lock. Memory use is a small index per
+        entry plus the entries of one path at a time.
+        """
+        with ExitStack() as stack:
+            with self._lock:
+                segments = self._segments()
+                if not segments:
+                    return True
+                # Seal the current segments; new appends go to the next number
+                last = int(_SEGMENT_RE.search(segments[-1].name).group(1))
+                self._segment_path(last + 1).touch()
+                sources = ([self.db_path] if self.db_path.exists() else []) + segments
+                # Two handles per file (sequential pass, random re-reads), opened
+                # now so a concurrent save_database cannot delete them mid-merge
+                files = [stack.enter_context(source.open("rb")) for source in sources]
+                readers = [stack.enter_context(source.open("rb")) for source in sources]
+
+            try:
+                if sources[0] == self.db_path and self._is_json_array(files[0]):
+                    # Legacy base: convert once so both passes can use line offsets
+                    text = io.TextIOWrapper(files[0], encoding="utf-8")
+                    converted, _ = self._write_temp(
+                        (self._dumps(r).encode("utf-8") for r in self._iter_json_array(text, self.db_path)),
+                        ".legacy.tmp"
+                    )
+                    text.detach()
+                    stack.callback(converted.unlink, missing_ok=True)
+                    files[0] = stack.enter_context(converted.open("rb"))
+                    readers[0] = stack.enter_context(converted.open("rb"))
+
+                keys, source_ids, offsets = self._index_entries(files)
+                tmp_path, count = self._write_temp(
+                    self._iter_compacted(files, readers, keys, source_ids, offsets), ".compact.tmp"
+                )
+
+                with self._lock:
+                    if not all(segment.exists() for segment in segments):
+                        # save_database rewrote the DB meanwhile; our merge is stale
+                        logger.info("DB was rewritten during compaction; discarding merge.")
+                        tmp_path.unlink(missing_ok=True)
+                        return False
+                    self._install_base(tmp_path)
+                    # Oldest first: a crash midway leaves a suffix of merged
+                    # segments, and replaying it onto the new base is harmless
+                    for segment in segments:
+                        segment.unlink()
+
+                logger.info(f"Compacted DB: {len(segments)} segments -> {count} records in {self.db_path}")
+                return True
+
+            except Exception as e:
+                logger.error(f"DB compaction failed, segments kept: {e}")
+                return False
 
     def _extract_filename_from_path(self, path: str) -> str:
         """
@@ -87,6 +664,10 @@ class JsonDatabase:
             logger.warning(f"Invalid DB record: missing 'path'. Record={record}")
             return False
         
+        # Metadata-only records are searchable but still waiting for the VLM
+        if record.get("tier") == "metadata":
+            return False
+
         # Ensure 'description' field exists and is not empty
         if "description" not in record or record["description"] is None or record["description"]=="":
             logger.warning(f"Invalid DB record: missing or empty description. Path={record.get('path')}")
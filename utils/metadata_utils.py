@@ -0,0 +1,96 @@
+import re
+from pathlib import Path
+from typing import Dict, List, Any
+
+from PIL import Image
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# EXIF tag ids (see PIL.ExifTags.TAGS)
+EXIF_IFD = 0x8769
+TAG_DATETIME = 306
+TAG_DATETIME_ORIGINAL = 36867
+TAG_MAKE = 271
+TAG_MODEL = 272
+
+# Number of parent folders whose names are indexed as keywords
+FOLDER_DEPTH = 3
+
+STOPWORDS = {"a", "an", "and", "the", "of", "on", "in", "at", "with", "to", "for", "img", "dsc"}
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and splits text into alphabetic / numeric tokens,
+    dropping stopwords and single characters.
+    """
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def extract_exif(image_path: str) -> Dict[str, str]:
+    """
+    Reads capture date and camera make/model from EXIF.
+    Returns an empty dict when the image has no (readable) EXIF.
+    """
+    try:
+        with Image.open(image_path) as img:
+            exif = img.getexif()
+            sub_ifd = exif.get_ifd(EXIF_IFD)
+
+            taken = sub_ifd.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)
+            make = exif.get(TAG_MAKE)
+            model = exif.get(TAG_MODEL)
+    except Exception as e:
+        logger.debug(f"EXIF read failed for {image_path}: {e}")
+        return {}
+
+    info = {}
+    if taken:
+        # EXIF format: "YYYY:MM:DD HH:MM:SS"
+        info["date"] = str(taken).strip().split(" ")[0].replace(":", "-")
+    if make:
+        info["camera_make"] = str(make).strip("\x00 ")
+    if model:
+        info["camera_model"] = str(model).strip("\x00 ")
+    return info
+
+
+def build_keywords(image_path: str, exif: Dict[str, str] = None) -> List[str]:
+    """
+    Cheap searchable tokens: filename, nearest folder names and EXIF fields.
+    """
+    path = Path(image_path)
+    parts = [path.stem] + [p.name for p in list(path.parents)[:FOLDER_DEPTH]]
+
+    if exif:
+        parts.extend(exif.values())
+
+    keywords = []
+    for part in parts:
+        for token in tokenize(part):
+            if token not in keywords:
+                keywords.append(token)
+
+    return keywords
+
+
+def build_metadata_record(image_path: str) -> Dict[str, Any]:
+    """
+    First-tier DB record: searchable by filename, folder and EXIF
+    before the VLM has described the image.
+    """
+    path = Path(image_path)
+    exif = extract_exif(image_path)
+
+    return {
+        "path": str(image_path),
+        "filename": path.name,
+        "folder": str(path.parent),
+        "exif": exif,
+        "keywords": build_keywords(image_path, exif),
+        "tier": "metadata"
+    }
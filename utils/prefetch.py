@@ -0,0 +1,192 @@
+import hashlib
+import itertools
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+READ_CHUNK = 1 << 20
+# Weight of the newest sample in the latency moving averages
+EWMA_ALPHA = 0.2
+# Subdirectory of prefetch_scratch_dir owned by the prefetcher
+SCRATCH_SUBDIR = "photo-finder-prefetch"
+# Scratch copies are named <16 hex digits of the path>-<fetch number><original suffix>
+_SCRATCH_RE = re.compile(r"^[0-9a-f]{16}-\d+\.[^.]+$")
+
+
+class ImagePrefetcher:
+    """
+    Reads upcoming images ahead of the VLM on a small thread pool, either
+    into the page cache or into a local scratch directory, so slow network
+    storage does not leave the model idle. The read-ahead depth follows
+    the ratio of observed read latency to per-image processing time.
+    """
+
+    def __init__(self, scratch_dir: Optional[str] = None):
+        base = scratch_dir or config.prefetch_scratch_dir
+        # Own a subdirectory, so cleanup never touches other files in a shared dir like /tmp
+        self.scratch_dir = Path(base) / SCRATCH_SUBDIR if base else None
+        if self.scratch_dir:
+            self.scratch_dir.mkdir(parents=True, exist_ok=True)
+            self._clear_stale_copies()
+
+        self._pool = ThreadPoolExecutor(max_workers=config.prefetch_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self.read_latency: Optional[float] = None
+        self.consume_time: Optional[float] = None
+        self.depth = config.prefetch_min_depth
+
+        # Scratch copies not yet released by done(); removed on close()
+        self._outstanding: Set[str] = set()
+        # Each fetch gets its own copy: the same image can be queued twice
+        # (folder and retry streams) and done() on one must not delete the other
+        self._fetch_ids = itertools.count()
+        self._closed = False
+
+
+    def _clear_stale_copies(self):
+        """
+        Removes copies left behind by an earlier run that did not shut down cleanly.
+        """
+        removed = 0
+        for entry in self.scratch_dir.iterdir():
+            if entry.is_file() and _SCRATCH_RE.match(entry.name):
+                try:
+                    entry.unlink()
+                    removed += 1
+                except OSError as e:
+                    logger.debug(f"Failed to remove stale scratch copy {entry}: {e}")
+        if removed:
+            logger.info(f"Removed {removed} stale prefetch copies from {self.scratch_dir}")
+
+
+    def _fetch(self, image_path: str) -> Tuple[str, float]:
+        """
+        Returns (path to read from, read seconds). Falls back to the
+        original path if the read-ahead fails.
+        """
+        start = time.monotonic()
+        try:
+            if self.scratch_dir:
+                digest = hashlib.blake2b(image_path.encode("utf-8"), digest_size=8).hexdigest()
+                with self._lock:
+                    fetch_id = next(self._fetch_ids)
+                local = self.scratch_dir / f"{digest}-{fetch_id}{Path(image_path).suffix}"
+                shutil.copyfile(image_path, local)
+                read_path = str(local)
+                with self._lock:
+                    closed = self._closed
+                    if not closed:
+                        self._outstanding.add(read_path)
+                if closed:
+                    # Finished after close(); nobody will release it
+                    os.remove(read_path)
+                    read_path = image_path
+            else:
+                with open(image_path, "rb") as f:
+                    if hasattr(os, "posix_fadvise"):
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    while f.read(READ_CHUNK):
+                        pass
+                read_path = image_path
+        except Exception as e:
+            logger.debug(f"Prefetch failed for {image_path}: {e}")
+            read_path = image_path
+
+        return read_path, time.monotonic() - start
+
+
+    @staticmethod
+    def _ewma(current: Optional[float], sample: float) -> float:
+        return sample if current is None else (1 - EWMA_ALPHA) * current + EWMA_ALPHA * sample
+
+
+    def _update_depth(self):
+        """
+        Enough reads in flight to cover one read latency at the current
+        processing rate, plus one spare.
+        """
+        if not self.read_latency or not self.consume_time:
+            return
+        wanted = math.ceil(self.read_latency / max(self.consume_time, 1e-3)) + 1
+        depth = max(config.prefetch_min_depth, min(config.prefetch_max_depth, wanted))
+        if depth != self.depth:
+            logger.debug(f"Prefetch depth {self.depth} -> {depth} "
+                         f"(read {self.read_latency:.2f}s, process {self.consume_time:.2f}s)")
+            self.depth = depth
+
+
+    def wrap(self, image_paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """
+        Yields (original path, path to read from) in input order,
+        keeping up to `depth` reads in flight ahead of the consumer.
+        """
+        paths = iter(image_paths)
+        window: deque = deque()
+        exhausted = False
+
+        while True:
+            while not exhausted and len(window) < self.depth:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+                window.append((path, self._pool.submit(self._fetch, path)))
+
+            if not window:
+                return
+
+            path, future = window.popleft()
+            read_path, latency = future.result()
+
+            with self._lock:
+                self.read_latency = self._ewma(self.read_latency, latency)
+                self._update_depth()
+
+            # Time until the consumer asks again = processing time per image
+            yielded_at = time.monotonic()
+            yield path, read_path
+            with self._lock:
+                self.consume_time = self._ewma(self.consume_time, time.monotonic() - yielded_at)
+
+
+    def done(self, read_path: str, image_path: str):
+        """
+        Releases a prefetched image once it has been processed.
+        """
+        if self.scratch_dir and read_path != image_path:
+            with self._lock:
+                self._outstanding.discard(read_path)
+            try:
+                os.remove(read_path)
+            except OSError as e:
+                logger.debug(f"Failed to remove scratch copy {read_path}: {e}")
+
+
+    def close(self):
+        """
+        Cancels pending reads and deletes scratch copies that were fetched
+        but never processed (read-ahead windows of unfinished folders).
+        """
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._closed = True
+            leftovers, self._outstanding = self._outstanding, set()
+        for read_path in leftovers:
+            try:
+                os.remove(read_path)
+            except OSError as e:
+                logger.debug(f"Failed to remove scratch copy {read_path}: {e}")
+        if leftovers:
+            logger.info(f"Removed {len(leftovers)} unused prefetch copies.")
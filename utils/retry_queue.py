@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Any
+
+from utils.json_db import write_json_atomic
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RetryQueue:
+    """
+    Persisted list of images whose processing failed, with exponential
+    backoff between attempts. Images are dropped from retries after
+    retry_max_attempts but kept in the file for inspection.
+    """
+
+    def __init__(self, queue_path: str = None):
+        self.queue_path = Path(queue_path or config.retry_queue_path)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.queue_path.exists():
+            return {}
+        try:
+            with self.queue_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                logger.error(f"Invalid retry queue format: expected dict, got {type(data)}")
+                return {}
+            logger.info(f"Loaded retry queue: {self.queue_path} | {len(data)} entries")
+            return data
+        except Exception as e:
+            logger.error(f"Failed to load retry queue: {e}")
+            return {}
+
+
+    def _save(self):
+        try:
+            write_json_atomic(self.queue_path, self.entries)
+        except Exception as e:
+            logger.error(f"Failed to save retry queue: {e}")
+
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        delay = config.retry_backoff_seconds * (2 ** (attempts - 1))
+        return min(delay, config.retry_backoff_max_seconds)
+
+
+    def record_failure(self, image_path: str, error: str):
+        with self._lock:
+            entry = self.entries.get(image_path, {"attempts": 0})
+            entry["attempts"] += 1
+            entry["last_error"] = error
+            entry["next_attempt"] = time.time() + self._backoff(entry["attempts"])
+            entry["exhausted"] = entry["attempts"] >= config.retry_max_attempts
+            self.entries[image_path] = entry
+            self._save()
+
+        if entry["exhausted"]:
+            logger.error(f"Giving up on {image_path} after {entry['attempts']} attempts: {error}")
+        else:
+            logger.warning(f"Queued for retry ({entry['attempts']}/{config.retry_max_attempts}): "
+                           f"{image_path} | {error}")
+
+
+    def record_success(self, image_path: str):
+        with self._lock:
+            if self.entries.pop(image_path, None) is not None:
+                logger.info(f"Retry succeeded: {image_path}")
+                self._save()
+
+
+    def due(self) -> List[str]:
+        """
+        Paths whose backoff has elapsed and that still have attempts left.
+        Files deleted or moved since they failed are given up on here.
+        """
+        now = time.time()
+        due, vanished = [], []
+        with self._lock:
+            for path, entry in self.entries.items():
+                if entry.get("exhausted") or entry.get("next_attempt", 0) > now:
+                    continue
+                if Path(path).exists():
+                    due.append(path)
+                else:
+                    entry["exhausted"] = True
+                    entry["last_error"] = "file no longer exists"
+                    vanished.append(path)
+            if vanished:
+                self._save()
+
+        for path in vanished:
+            logger.warning(f"Dropping retry, file no longer exists: {path}")
+        return due
+
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for e in self.entries.values() if not e.get("exhausted"))
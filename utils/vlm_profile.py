@@ -0,0 +1,70 @@
+import json
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Dict, Optional, Any
+
+from utils.json_db import write_json_atomic
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# ModelConfig fields the autotuner is allowed to set
+TUNABLE_PARAMS = ("n_threads", "n_threads_batch", "n_batch", "n_ubatch")
+
+
+def host_key() -> str:
+    """
+    Identifies the machine a profile was tuned on.
+    """
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()}cpu"
+
+
+def _load_profiles(profiles_path: Path) -> Dict[str, Any]:
+    if not profiles_path.exists():
+        return {}
+    try:
+        with profiles_path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception as e:
+        logger.error(f"Failed to load VLM profiles: {e}")
+        return {}
+
+
+def load_host_profile(profiles_path: str = None) -> Optional[Dict[str, int]]:
+    """
+    Returns the tuned ModelConfig parameters for this host, if any.
+    A profile tuned for a different model is ignored.
+    """
+    profiles_path = Path(profiles_path or config.vlm_profiles_path)
+    profile = _load_profiles(profiles_path).get(host_key())
+    if not profile:
+        return None
+    if profile.get("model") != str(config.vlm_model_path):
+        logger.info(f"VLM profile for {host_key()} was tuned for {profile.get('model')}; "
+                    f"ignoring it for {config.vlm_model_path}. Run autotune again.")
+        return None
+    return {k: v for k, v in profile.get("params", {}).items() if k in TUNABLE_PARAMS}
+
+
+def save_host_profile(params: Dict[str, int], metrics: Dict[str, float], profiles_path: str = None) -> bool:
+    profiles_path = Path(profiles_path or config.vlm_profiles_path)
+    profiles = _load_profiles(profiles_path)
+
+    profiles[host_key()] = {
+        "params": params,
+        "metrics": metrics,
+        "model": str(config.vlm_model_path),
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+    try:
+        write_json_atomic(profiles_path, profiles)
+        logger.info(f"Saved VLM profile for {host_key()}: {params}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save VLM profile: {e}")
+        return False